@@ -0,0 +1,169 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+:Name:
+    build_state.py
+
+:Authors:
+    Soufian Salim (soufi@nsal.im)
+"""
+
+import cPickle
+import os
+
+from vocabulary import Vocabulary
+
+
+VERSION = 2 # format of the saved states, states of other formats are ignored (the next build is a full rebuild)
+
+class BuildState(object):
+    """
+    Corpus statistics and source files of a build, persisted so that the next build only featurizes new files
+    The outputs of a build are discretized with the averages and the vocabulary computed when they were first written,
+    which are kept along with the statistics of the whole corpus (updated as files are added) to detect threshold drift
+    """
+
+    def __init__(self, settings):
+        self.settings = settings # options the outputs depend on
+        self.files = {} # filename => (size, mtime)
+
+        # statistics of all the built files
+        self.stylistic_features_sums = {}
+        self.instances = 0
+        self.token_counts = Vocabulary().counts
+
+        # thresholds used by the outputs
+        self.averages = {}
+        self.relevant_vocabulary = set()
+
+    def add_files(self, manifest, filenames):
+        """
+        Record the size and mtime of built files
+        """
+
+        for filename in filenames:
+            record = manifest[filename]
+
+            self.files[filename] = (record.size, record.mtime)
+
+    def add_statistics(self, stylistic_features_sums, instances, token_counts):
+        """
+        Add the statistics of newly built files
+        """
+
+        for name, value in stylistic_features_sums.iteritems():
+            self.stylistic_features_sums[name] = self.stylistic_features_sums.get(name, 0.0) + value
+
+        self.instances += instances
+
+        # both counts have their own vocabulary
+        tokens, counts = zip(*token_counts.iteritems()) if token_counts.total > 0 else ((), ())
+
+        self.token_counts.add_counts(self.token_counts.vocabulary.add(tokens), counts)
+
+    def compare_files(self, manifest, filenames):
+        """
+        Returns the new files, the changed files and the removed files (built files that are not in filenames anymore)
+        """
+
+        new_files, changed_files = [], []
+
+        for filename in filenames:
+            record = manifest[filename]
+            built = self.files.get(filename)
+
+            if built is None:
+                new_files.append(filename)
+            elif built != (record.size, record.mtime):
+                changed_files.append(filename)
+
+        selected = set(filenames)
+
+        removed_files = sorted(filename for filename in self.files if filename not in selected)
+
+        return new_files, changed_files, removed_files
+
+    def relevant_tokens(self, occurrence_threshold_quotient):
+        """
+        Tokens with required frequency in the whole corpus
+        """
+
+        return self.token_counts.frequent_tokens(self.token_counts.total * occurrence_threshold_quotient)
+
+    def drift(self, occurrence_threshold_quotient, tolerance):
+        """
+        Returns the reasons why the outputs' thresholds do not fit the whole corpus anymore (relative changes above tolerance)
+        """
+
+        reasons = []
+
+        # without instances (all built files empty or filtered out), there is no average to compare
+        for name, average in sorted(self.averages.iteritems()) if self.instances > 0 else []:
+            current_average = self.stylistic_features_sums[name] / self.instances
+
+            if abs(current_average - average) > tolerance * abs(average):
+                reasons.append("average {0} drifted from {1:.4f} to {2:.4f}".format(name, average, current_average))
+
+        vocabulary = self.relevant_tokens(occurrence_threshold_quotient)
+        changes = len(vocabulary ^ self.relevant_vocabulary)
+
+        if changes > tolerance * len(self.relevant_vocabulary):
+            reasons.append("{0} tokens entered or left the relevant vocabulary of {1} tokens".format(
+                changes, len(self.relevant_vocabulary)
+            ))
+
+        return reasons
+
+
+def load_build_state(path):
+    """
+    Read a build state written by save_build_state, returns None if there is none or if it was saved in another format
+    """
+
+    if not path or not os.path.exists(path):
+        return None
+
+    with open(path, "rb") as state_file:
+        attributes = cPickle.load(state_file)
+
+    if attributes.pop("version", None) != VERSION:
+        return None
+
+    tokens = attributes.pop("tokens")
+    token_occurrences = attributes.pop("token_occurrences")
+    total_token_count = attributes.pop("total_token_count")
+
+    state = BuildState(attributes["settings"])
+    state.__dict__.update(attributes)
+
+    state.token_counts.add_counts(state.token_counts.vocabulary.add(tokens), token_occurrences)
+    state.token_counts.total = total_token_count
+
+    return state
+
+
+def save_build_state(state, path):
+    """
+    Write a build state to disk (as a dictionary, so that it does not depend on the module's import path)
+    """
+
+    attributes = dict(vars(state))
+    attributes["version"] = VERSION
+    token_counts = attributes.pop("token_counts")
+
+    attributes["tokens"] = token_counts.vocabulary.tokens
+    attributes["token_occurrences"] = token_counts.array[:len(token_counts.vocabulary)]
+    attributes["total_token_count"] = token_counts.total
+
+    folder = os.path.dirname(path)
+
+    if folder and not os.path.exists(folder):
+        os.makedirs(folder)
+
+    temporary_path = "{0}.{1}.tmp".format(path, os.getpid())
+
+    with open(temporary_path, "wb") as out:
+        cPickle.dump(attributes, out, cPickle.HIGHEST_PROTOCOL)
+
+    os.rename(temporary_path, path) # atomic, a partially written state is never read
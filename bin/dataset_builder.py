@@ -12,31 +12,59 @@
 import codecs
 import doctest
 import math
+import numpy as np
 import os
 
-from nltk import pos_tag
-from nltk.stem.wordnet import WordNetLemmatizer
+from build_state import BuildState, load_build_state, save_build_state
+from feature_schema import GROUPS, make_schema, project_schema, save_schema, schema_columns
+from io import BytesIO
+from lemmatization import LemmaCache, coarse_pos
+from manifest import update_manifest, query_manifest
+from multiprocessing import Pool
+from ngram_matcher import NgramMatcher
 from optparse import OptionParser
+from parse_cache import parsed_file_key, cache_path, is_cacheable, read_parsed_file, write_parsed_file
 from progressbar import ProgressBar
-from utility import timed_print, compute_file_length, average, standard_deviation
+from sketches import StreamingStatistics
+from sparse_matrix import FORMATS as MATRIX_FORMATS, SparseMatrixBuilder
+from stylistic import analyze_line
+from symbols import SymbolTable
+from tagging import TagCache, pos_tag_sents
+from text_tiling_store import TextTilingStore
+from utility import timed_print, compute_lines_length, average, standard_deviation, peak_memory_usage
+from vocabulary import Vocabulary
+from vectorized import NUMERIC_FEATURE_NAMES, measure_lines, accumulate_sums, discretize_values, discretize_quartiles, tier_tokens
 
 # default parameters
 
 OCCURRENCE_THRESHOLD_QUOTIENT = 0.075 / 150 # words that appear less than (quotient * total tokens) times are ignored
+ONE_PASS_BUFFER_SIZE = 10000 # minimum number of lines featurized at once when reading the corpus in one pass
+DRIFT_TOLERANCE = 0.05 # relative change of the corpus statistics above which incremental outputs should be rebuilt
 
 # default paths
 
 DATA_FOLDER = "../data/email.message.tagged/" # folder where heuristically labelled emails are stored
 TT_FOLDER = "../data/TT/ubuntu-users/" # folder where emails labelled by text-tiling are stored
 NGRAMS_FILE = "../var/ngrams" # file containing relevant ngrams
+MANIFEST_FILE = "../data/manifest.tsv" # index of the data folder's metadata and file lengths
+PARSE_CACHE_FOLDER = "../var/cache/parsed/" # binary cache of parsed files, keyed by content hash
+TAG_CACHE_FILE = "../var/cache/tags.pickle" # part-of-speech tags of already tagged sentences
+LEMMA_CACHE_FILE = "../var/cache/lemmas.pickle" # lemmas of recently lemmatized tokens
+LEMMA_CACHE_SIZE = 100000 # maximum number of lemmas kept in memory
+TT_STORE_FILE = "../var/cache/text_tiling.labels" # bit-packed text tiling labels of the corpus' messages
+BUILD_STATE_FILE = "../var/build_state.pickle" # statistics and source files of the previous incremental build
 
 WAPITI_TRAIN_FILE = "../var/wapiti_train.tsv"
 WAPITI_TEST_FILE = "../var/wapiti_test.tsv"
 WAPITI_GOLD_FILE = "../var/wapiti_gold.tsv"
 WAPITI_ORIGIN_FILE = "../var/wapiti_origin.tsv"
+WAPITI_SCHEMA_FILE = "../var/wapiti_schema.json" # columns of the wapiti datafiles
+WAPITI_SYMBOLS_FILE = "../var/wapiti_symbols.tsv" # values of the symbols of encoded wapiti datafiles
 
 WEKA_ARFF_FILE = "../var/weka.arff"
 
+MATRIX_FILE = "../var/matrix" # sparse feature matrix (the extension of its format is added)
+
 # constants
 
 LABELS = ["T", "F"]
@@ -48,7 +76,7 @@ def build_datasets(opts):
     """
     
     # filenames
-    data_folder_files = os.listdir(opts.data_folder)
+    manifest, data_folder_files = update_manifest(opts.data_folder, opts.manifest_file)
 
     if options.limit > 0:
         data_folder_files = data_folder_files[:options.limit]
@@ -61,13 +89,14 @@ def build_datasets(opts):
 
     print("# {0} ngrams extracted".format(len(ngrams)))
 
+    # all ngrams are matched in a single scan of each line
+    ngram_matcher = NgramMatcher(ngrams)
+
     ########################################
 
     timed_print("computing maximum file length...")
 
-    max_file_length = compute_max_file_length(
-        [opts.data_folder + filename for filename in data_folder_files]
-    )
+    max_file_length = compute_max_file_length(manifest, data_folder_files)
 
     print("# maximum file length: {0} lines".format(max_file_length))
 
@@ -76,7 +105,7 @@ def build_datasets(opts):
     timed_print("selecting source files...")
 
     selected_files = select_data_files(
-        opts.data_folder,
+        manifest,
         data_folder_files,
         max_file_length=max_file_length,
         only_initial=opts.only_initial, only_utf8=opts.only_utf8, only_text_plain=opts.only_text_plain
@@ -85,9 +114,52 @@ def build_datasets(opts):
     print("# {0} source files selected".format(len(selected_files)))
 
     ########################################
-    
-    # number of lines in datasets
-    instances = 0
+
+    build_settings = make_build_settings(opts, ngrams)
+    build_state = None # previous build, whose outputs new files are appended to
+    rebuild_reasons = []
+
+    if opts.incremental:
+        timed_print("comparing source files with the previous build...")
+
+        build_state = load_build_state(opts.build_state_file) if not opts.rebuild else None
+
+        if opts.rebuild:
+            print("# rebuilding all source files")
+        elif build_state is None:
+            print("# no previous build (or one saved in an outdated format), all source files are built")
+        elif build_state.settings != build_settings:
+            print("# build settings changed since the previous build, all source files are built")
+
+            build_state = None
+        else:
+            new_files, changed_files, removed_files = build_state.compare_files(manifest, selected_files)
+
+            print("# {0} new, {1} changed and {2} removed source files".format(
+                len(new_files), len(changed_files), len(removed_files)
+            ))
+
+            # the rows of changed or removed files cannot be taken out of the outputs
+            if len(changed_files) > 0:
+                rebuild_reasons.append("{0} source files changed since they were built".format(len(changed_files)))
+
+            if len(removed_files) > 0:
+                rebuild_reasons.append("{0} built source files were removed or are not selected anymore".format(len(removed_files)))
+
+            if len(new_files) == 0:
+                report_rebuild_reasons(rebuild_reasons + build_state.drift(opts.occurrence_threshold_quotient, opts.drift_tolerance))
+
+                return
+
+            selected_files = new_files
+    else:
+        previous_build_state = load_build_state(opts.build_state_file)
+
+        # the outputs of the previous incremental build are overwritten
+        if previous_build_state is not None and previous_build_state.settings == build_settings:
+            os.remove(opts.build_state_file)
+
+    ########################################
 
     # names of numeric stylistic features (that require an average value for discretization)
     numeric_feature_names = [
@@ -101,203 +173,544 @@ def build_datasets(opts):
         "proportion_of_numeric_chars"
     ]
 
-    # sums of stylistic features values
-    stylistic_features_sums = {f:0.0 for f in numeric_feature_names}
+    ########################################
 
-    token_counter = {}
-    total_token_count = 0
+    cache_folder = opts.parse_cache_folder if not opts.no_cache else None
 
-    ########################################
+    tag_cache = TagCache(opts.tag_cache_file if not opts.no_cache else None)
+    lemma_cache = LemmaCache(max_size=opts.lemma_cache_size, path=opts.lemma_cache_file if not opts.no_cache else None)
 
-    timed_print("computing stylistic features' sums, counting tokens, counting file lengths...")
-    
-    progress = ProgressBar()
-
-    for file_data in progress(parse_data_files(
-        opts.data_folder, opts.text_tiling_folder, selected_files
-    )):
-        for line, tokens, label, tt_label, line_number, total_lines in file_data:
-            # updating stylistic features' sums
-            stylistic_features_sums, instances = update_stylistic_features_sums(
-                stylistic_features_sums, instances, line, tokens, line_number, total_lines
-            )
+    # text tiling labels are read once, from the store if they were read by a previous build
+    text_tiling_labels = TextTilingStore(opts.text_tiling_folder, opts.text_tiling_store_file if not opts.no_cache else None)
+
+    if opts.one_pass:
+        timed_print("parsing source files, computing features, exporting Wapiti datafiles and Weka .arff file...")
+
+        # features are discretized with the statistics of the lines read so far, a buffer of lines at a time
+        discretized_datasets = featurize_in_one_pass(
+            opts.data_folder, text_tiling_labels, selected_files,
+            ngram_matcher, tag_cache, lemma_cache, opts.occurrence_threshold_quotient,
+            cache_folder=cache_folder, buffer_size=opts.buffer_size, quartile_tiers=opts.quartile_tiers
+        )
+    else:
+        timed_print("parsing source files, computing stylistic features' sums, counting tokens...")
+
+        # single pass over the corpus, the parsed files are kept for featurization unless streaming or sharding
+        parsed_files, stylistic_features_sums, instances, token_counts = collect_corpus_statistics(
+            opts.data_folder, text_tiling_labels, selected_files, numeric_feature_names,
+            cache_folder=cache_folder, keep_parsed=not opts.streaming and opts.workers <= 1, vectorized=opts.vectorized
+        )
+
+        ########################################
+
+        timed_print("computing average stylistic features...")
 
-            # updating the token counter
-            token_counter, total_token_count = update_token_count(
-                token_counter, total_token_count, tokens
+        progress = ProgressBar()
+
+        average_stylistic_features = {f:stylistic_features_sums[f] / instances for f in progress(numeric_feature_names)}
+
+        ########################################
+
+        timed_print("computing features, exporting Wapiti datafiles and Weka .arff file...")
+
+        if opts.vocabulary_file:
+            token_counts.vocabulary.save(opts.vocabulary_file)
+
+        min_occurrences = token_counts.total * opts.occurrence_threshold_quotient
+
+        # tokens with required frequency
+        relevant_vocabulary = token_counts.frequent_tokens(min_occurrences)
+
+        if build_state is not None:
+            # new files are discretized with the thresholds of the outputs they are appended to
+            average_stylistic_features = build_state.averages
+            relevant_vocabulary = build_state.relevant_vocabulary
+
+        if opts.workers > 1:
+            # files are sharded across worker processes, which parse them again (or read them from the cache)
+            datasets = featurize_data_files_in_parallel(
+                opts.data_folder, text_tiling_labels, selected_files,
+                ngram_matcher, relevant_vocabulary, tag_cache, lemma_cache,
+                opts.workers, cache_folder=cache_folder
             )
+        else:
+            if opts.streaming:
+                # files are parsed again (or read from the cache) instead of being kept in memory
+                files_data = parse_data_files(opts.data_folder, text_tiling_labels, selected_files, cache_folder=cache_folder)
+            else:
+                files_data = (unpack_parsed_file(parsed_file) for parsed_file in parsed_files)
 
-    ########################################
+            datasets = featurize_data_files(files_data, len(selected_files), ngram_matcher, relevant_vocabulary, tag_cache, lemma_cache)
 
-    timed_print("computing average stylistic features...")
+        discretized_datasets = discretize_datasets(datasets, average_stylistic_features, vectorized=opts.vectorized)
 
-    progress = ProgressBar()
+    # featurized messages are written as soon as they are computed
+    export_datasets(
+        discretized_datasets,
+        opts.wapiti_train_file, opts.wapiti_test_file, opts.wapiti_gold_file, opts.wapiti_origin_file,
+        opts.weka_arff_file, LABELS,
+        schema_file=opts.wapiti_schema_file, feature_groups=opts.feature_groups,
+        symbols_file=opts.wapiti_symbols_file if opts.encoded else None, sparse_arff=opts.sparse_arff,
+        matrix_file=opts.matrix_file, matrix_format=opts.matrix_format,
+        append=build_state is not None
+    )
 
-    average_stylistic_features = {f:stylistic_features_sums[f] / instances for f in progress(numeric_feature_names)}
+    if opts.incremental:
+        if build_state is None:
+            build_state = BuildState(build_settings)
+            build_state.averages = average_stylistic_features
+            build_state.relevant_vocabulary = relevant_vocabulary
 
-    ########################################
+        build_state.add_statistics(stylistic_features_sums, instances, token_counts)
+        build_state.add_files(manifest, selected_files)
+
+        report_rebuild_reasons(rebuild_reasons + build_state.drift(opts.occurrence_threshold_quotient, opts.drift_tolerance))
+
+        save_build_state(build_state, opts.build_state_file)
+
+    tag_cache.save()
+    lemma_cache.save()
+    text_tiling_labels.save()
+
+    print("# lemma cache: {0}".format(lemma_cache.statistics()))
+
+    print("# peak memory usage: {0:.1f} MB".format(peak_memory_usage()))
+
+
+def make_build_settings(opts, ngrams):
+    """
+    Options the outputs of a build depend on: new files are only appended to outputs built with the same settings
+    """
+
+    settings = {name: getattr(opts, name) for name in [
+        "data_folder", "text_tiling_folder", "limit", "only_initial", "only_utf8", "only_text_plain",
+        "occurrence_threshold_quotient", "feature_groups", "encoded", "sparse_arff",
+        "wapiti_train_file", "wapiti_test_file", "wapiti_gold_file", "wapiti_origin_file",
+        "wapiti_schema_file", "wapiti_symbols_file", "weka_arff_file"
+    ]}
+
+    settings["ngrams"] = ngrams
 
-    timed_print("computing features...")
+    return settings
 
-    wnl = WordNetLemmatizer()
 
-    min_occurrences = total_token_count * opts.occurrence_threshold_quotient
+def report_rebuild_reasons(reasons):
+    """
+    Display why the outputs of incremental builds should be rebuilt from scratch
+    """
+
+    for reason in reasons:
+        print("# full rebuild required (--rebuild): {0}".format(reason))
+
+
+def featurize_data_files(files_data, file_count, ngram_matcher, relevant_vocabulary, tag_cache, lemma_cache):
+    """
+    Yields the featurized lines of each parsed file
+    """
+
+    progress = ProgressBar(maxval=file_count).start()
 
-    # datasets format:
-    # [ # one email
-    #   [ # one message
-    #       ( # one line
-    #           label, 
-    #           line, 
-    #           [(value, name, type), ...]
-    #       ),
-    #       ...
-    #   ],
+    for i, file_data in enumerate(files_data):
+        progress.update(i)
+
+        yield featurize_data_file(file_data, ngram_matcher, relevant_vocabulary, tag_cache, lemma_cache)
+
+    progress.finish()
+
+
+def featurize_data_files_in_parallel(
+    folder, text_tiling_labels, filenames, 
+    ngram_matcher, relevant_vocabulary, tag_cache, lemma_cache,
+    workers, cache_folder=None, chunk_size=16
+):
+    """
+    Yields the featurized lines of each file, files being parsed and featurized by a pool of worker processes
+    Results are yielded in the order of the given filenames, tags and lemmas computed by workers are merged into the caches
+    """
+
+    pool = Pool(
+        processes=workers,
+        initializer=initialize_featurization_worker,
+        initargs=(folder, text_tiling_labels, cache_folder, ngram_matcher, relevant_vocabulary, tag_cache, lemma_cache)
+    )
+
+    progress = ProgressBar(maxval=len(filenames)).start()
+
+    try:
+        # only filenames are sent to the workers, which parse files themselves
+        for i, (dataset, tagged, lemmatized) in enumerate(pool.imap(featurize_worker_file, filenames, chunk_size)):
+            progress.update(i)
+
+            tag_cache.update(tagged)
+            lemma_cache.merge_changes(lemmatized)
+
+            yield dataset
+
+        pool.close()
+    except:
+        pool.terminate()
+        raise
+    finally:
+        pool.join()
+
+    progress.finish()
+
+
+# state of a featurization worker process, set once by its initializer
+worker_state = {}
+
+
+def initialize_featurization_worker(
+    folder, text_tiling_labels, cache_folder, 
+    ngram_matcher, relevant_vocabulary, tag_cache, lemma_cache
+):
+    """
+    Prepare a featurization worker, preloading the tagger and the lemmatizer
+    """
+
+    # both models are lazily loaded on first use
+    pos_tag_sents([["preloading", "the", "tagger"]])
+    lemma_cache.lemmatizer.lemmatize("preloading")
+
+    # the parent process already knows the inherited entries
+    tag_cache.pop_added()
+    lemma_cache.pop_changes()
+
+    worker_state.update(
+        folder=folder,
+        text_tiling_labels=text_tiling_labels,
+        cache_folder=cache_folder,
+        ngram_matcher=ngram_matcher,
+        relevant_vocabulary=relevant_vocabulary,
+        tag_cache=tag_cache,
+        lemma_cache=lemma_cache
+    )
+
+
+def featurize_worker_file(filename):
+    """
+    Parse and featurize a file in a worker process
+    Returns the featurized lines along with the newly tagged sentences and lemmatized tokens
+    """
+
+    tag_cache = worker_state["tag_cache"]
+    lemma_cache = worker_state["lemma_cache"]
+
+    for file_data in parse_data_files(
+        worker_state["folder"], worker_state["text_tiling_labels"], [filename], 
+        cache_folder=worker_state["cache_folder"]
+    ):
+        dataset = featurize_data_file(
+            file_data, worker_state["ngram_matcher"], worker_state["relevant_vocabulary"], tag_cache, lemma_cache
+        )
+
+        return dataset, tag_cache.pop_added(), lemma_cache.pop_changes()
+
+
+def featurize_data_file(file_data, ngram_matcher, relevant_vocabulary, tag_cache, lemma_cache):
+    """
+    Featurize the lines of a parsed file
+    """
+
+    # dataset format:
+    # [ # one message
+    #   ( # one line
+    #       label, 
+    #       line, 
+    #       [(value, name, type), ...]
+    #   ),
     #   ...
     # ]
+
+    dataset = []
+
+    file_data = list(file_data)
+
+    # tokens with required frequency
+    lines_relevant_tokens = [
+        [t for t in tokens if t.lower() in relevant_vocabulary] 
+            for line, tokens, label, tt_label, line_number, total_lines in file_data
+    ]
+
+    # all of the message's sentences are tagged in a single batch
+    tag_cache.prefetch(
+        [tokens for line, tokens, label, tt_label, line_number, total_lines in file_data] + lines_relevant_tokens
+    )
     
-    datasets = []
+    for (line, tokens, label, tt_label, line_number, total_lines), relevant_tokens in zip(file_data, lines_relevant_tokens):
+        # [tag]
+        tags = [tag for token, tag in  tag_cache.tag(tokens)]
 
-    progress = ProgressBar()
+        # [(token, lemma, tag)]
+        tokens_lemmas_tags = [
+            (token, lemma_cache.lemmatize(token.lower(), coarse_pos(tag)), tag)
+                for token, tag in tag_cache.tag(relevant_tokens)
+        ]
 
-    for file_data in progress(parse_data_files(
-        opts.data_folder, opts.text_tiling_folder, selected_files
-    )):
-        dataset = []
-        
-        for line, tokens, label, tt_label, line_number, total_lines in file_data:
-            # tokens with required frequency
-            relevant_tokens = [t for t in tokens if token_counter[t.lower()] > min_occurrences]
+        # building syntactic features (hinge tokens)
+        syntactic_features = make_syntactic_features(tokens_lemmas_tags)
 
-            # [tag]
-            tags = [tag for token, tag in  pos_tag(tokens)]
+        # building stylistic features (hand-written features)
+        stylistic_features = make_stylistic_features(line, tokens, tags, line_number, total_lines)
 
-            # [(token, lemma, tag)]
-            tokens_lemmas_tags = [
-                (token, wnl.lemmatize(token.lower(), "v" if tag.startswith("V") else "n"), tag)
-                    for token, tag in pos_tag(relevant_tokens)
-            ]
+        # building lexical features (ngrams)
+        lexical_features = make_lexical_features(ngram_matcher, line)
 
-            # building syntactic features (hinge tokens)
-            syntactic_features = make_syntactic_features(tokens_lemmas_tags)
+        # building thematic features (Text Tiling)
+        thematic_features = [(tt_label, "text_tiling_boundary", "{S,O}")]
 
-            # building stylistic features (hand-written features)
-            stylistic_features = make_stylistic_features(line, tokens, tags, line_number, total_lines)
+        dataset.append((
+            label,
+            line,
+            syntactic_features + stylistic_features + lexical_features + thematic_features
+        ))
 
-            # building lexical features (ngrams)
-            lexical_features = make_lexical_features(ngrams, line)
+    return dataset
 
-            # building thematic features (Text Tiling)
-            thematic_features = [(tt_label, "text_tiling_boundary", "{S,O}")]
 
-            dataset.append((
-                label,
-                line,
-                syntactic_features + stylistic_features + lexical_features + thematic_features
-            ))
+def export_datasets(
+    discretized_datasets,
+    train_file, test_file, gold_file, origin_file, 
+    arff_file, labels,
+    schema_file=None, feature_groups=GROUPS, symbols_file=None, sparse_arff=False,
+    matrix_file=None, matrix_format=None, append=False
+):
+    """
+    Exports datasets (along with the discrete features of their lines) to wapiti train, test, gold and origin files
+    and to a Weka ARFF file, one message at a time
+    Only the given feature groups are written to wapiti datafiles, whose columns are described in the schema file
+    If a symbols file is given, features are written as short symbols whose values are stored in that file
+    If sparse_arff is set, the ARFF file only contains non-default values
+    If a matrix format is given, features are also written as a sparse matrix (npz or svmlight) to the matrix file
+    If append is set, datasets are appended to the outputs of a previous build (whose ARFF header, schema and symbols are kept)
+    """
 
-        datasets.append(dataset)
-    
-    ########################################
+    mode = "a" if append else "w"
+
+    with codecs.open(train_file, mode) as train_out:
+        with codecs.open(test_file, mode) as test_out:
+            with codecs.open(gold_file, mode) as gold_out:
+                with codecs.open(origin_file, mode) as origin_out:
+                    with codecs.open(arff_file, mode) as arff_out:
+                        arff_header_written = append
+                        features_described = False
+                        wapiti_columns = None # indexes of the columns written to wapiti datafiles (None for all)
+                        symbol_table = SymbolTable(path=symbols_file if append else None) if symbols_file else None
+                        matrix_builder = SparseMatrixBuilder(labels) if matrix_format else None
+
+                        for dataset, discrete_features in discretized_datasets:
+                            if not features_described and len(dataset) > 0:
+                                # attributes are those of the first line
+                                if not arff_header_written:
+                                    write_weka_arff_header(arff_out, dataset[0][2], labels, sparse=sparse_arff)
+                                    arff_header_written = True
+
+                                wapiti_columns, schema = export_feature_schema(
+                                    dataset[0][2], labels, feature_groups, None if append else schema_file,
+                                    encoded=symbol_table is not None
+                                )
+                                features_described = True
+
+                                if symbol_table is not None:
+                                    # text tiling labels are read as they are by the evaluation
+                                    symbol_table.verbatim_columns = set(i for i, group, column in schema_columns(schema, ["thematic"]))
+
+                            write_wapiti_dataset(
+                                dataset, discrete_features, train_out, test_out, gold_out, origin_out, 
+                                columns=wapiti_columns, symbol_table=symbol_table
+                            )
+                            if sparse_arff:
+                                write_weka_arff_sparse_dataset(dataset, arff_out, labels)
+                            else:
+                                write_weka_arff_dataset(dataset, arff_out)
+
+                            if matrix_builder is not None:
+                                matrix_builder.add_dataset(dataset)
+
+                        if not arff_header_written:
+                            write_weka_arff_header(arff_out, [], labels, sparse=sparse_arff)
+
+                            export_feature_schema([], labels, feature_groups, schema_file, encoded=symbol_table is not None)
+
+                        if symbol_table is not None:
+                            symbol_table.save(symbols_file)
+
+                        if matrix_builder is not None:
+                            matrix_builder.save("{0}.{1}".format(matrix_file, matrix_format), matrix_format)
+
+
+def export_feature_schema(features, labels, feature_groups, schema_file=None, encoded=False):
+    """
+    Writes the schema of the wapiti datafiles given the features of a line, restricted to the given groups
+    Returns the indexes of the features to write (None if all of them are written) and the schema
+    """
 
-    timed_print("exporting Wapiti datafiles...")
+    groups = [(group, []) for group in GROUPS]
+    group_columns = dict(groups)
+
+    for value, name, attribute_type in features:
+        group_columns[feature_group(name)].append((name, attribute_type))
+
+    schema, columns = project_schema(make_schema(groups, labels), feature_groups)
+    schema["encoded"] = encoded
+
+    if schema_file:
+        save_schema(schema, schema_file)
+
+    return columns if len(columns) < len(features) else None, schema
 
-    export_wapiti_datafiles(
-        datasets, 
-        average_stylistic_features, 
-        opts.wapiti_train_file, opts.wapiti_test_file, opts.wapiti_gold_file, opts.wapiti_origin_file
-    )
-    
-    ########################################
 
-    timed_print("exporting Weka .arff file...")
+def feature_group(name):
+    """
+    Group of a feature given its name
+    """
+
+    if name.startswith("hinge_"):
+        return "syntactic"
+    elif name.startswith("ngram_"):
+        return "lexical"
+    elif name == "text_tiling_boundary":
+        return "thematic"
 
-    export_weka_arff(datasets, opts.weka_arff_file, LABELS)
+    return "stylistic"
 
 
-def export_weka_arff(datasets, arff_file, labels):
+def write_weka_arff_header(out, features, labels, sparse=False):
     """
-    Exports the dataset to a Weka ARFF file
+    Writes the header of a Weka ARFF file
+    In sparse files, boolean attributes are declared as {FALSE, TRUE} so that FALSE, their first value, is the default one
     """
 
     forbidden_types = ["string"] # not handled by all Weka classifiers
 
-    with codecs.open(arff_file, "w") as out:
-        # write header
-        out.write("@relation segmenter\n\n")
+    out.write("@relation segmenter\n\n")
 
-        # writing attributes
-        features_0 = datasets[0][0][2] # first line's features
-        attributes = [(name, attribute_type) for value, name, attribute_type in features_0 if attribute_type not in forbidden_types]
+    # writing attributes
+    attributes = [(name, attribute_type) for value, name, attribute_type in features if attribute_type not in forbidden_types]
 
-        for feature_name, feature_type in attributes:
-            if feature_type not in forbidden_types:
-                out.write("@attribute {0} {1}\n".format(feature_name, feature_type))
+    for feature_name, feature_type in attributes:
+        if feature_type not in forbidden_types:
+            if sparse and feature_type == "{TRUE, FALSE}":
+                feature_type = "{FALSE, TRUE}"
 
-        # writing labels
-        out.write("@attribute class {")
-        out.write(",".join(labels))
-        out.write("}\n\n")
+            out.write("@attribute {0} {1}\n".format(feature_name, feature_type))
 
-        # writing data
-        out.write("@data\n")
+    # writing labels
+    out.write("@attribute class {")
+    out.write(",".join(labels))
+    out.write("}\n\n")
 
-        for dataset in datasets:
-            for label, line, features in dataset:
-                for i, (raw_value, name, attribute_type) in enumerate(features):
-                    if attribute_type == "{TRUE, FALSE}": 
-                        # {TRUE, FALSE}
-                        value = "TRUE" if raw_value else "FALSE" 
-                    elif attribute_type == "string": 
-                        # strings are quoted and quotes are escaped
-                        value = "'{0}'".format(raw_value.replace("'", "\\'")) 
-                    else: 
-                        # other values are cast to string
-                        value = str(raw_value) 
-                    
-                    out.write("{0},".format(value))
+    # writing data
+    out.write("@data\n")
 
-                    if i == len(features) - 1:
-                        out.write(label)
 
-                out.write("\n")
+def write_weka_arff_dataset(dataset, out):
+    """
+    Writes the lines of a message to a Weka ARFF file
+    """
+
+    for label, line, features in dataset:
+        for i, (raw_value, name, attribute_type) in enumerate(features):
+            if attribute_type == "{TRUE, FALSE}": 
+                # {TRUE, FALSE}
+                value = "TRUE" if raw_value else "FALSE" 
+            elif attribute_type == "string": 
+                # strings are quoted and quotes are escaped
+                value = "'{0}'".format(raw_value.replace("'", "\\'")) 
+            else: 
+                # other values are cast to string
+                value = str(raw_value) 
+            
+            out.write("{0},".format(value))
+
+            if i == len(features) - 1:
+                out.write(label)
 
+        out.write("\n")
 
-def export_wapiti_datafiles(datasets, averages, train_file, test_file, gold_file, origin_file):
+
+def write_weka_arff_sparse_dataset(dataset, out, labels):
     """
-    Exports wapiti train, test and gold files
+    Writes the lines of a message to a sparse Weka ARFF file: only values that differ from their attribute's default are written,
+    along with the index of the attribute (string features, which are not declared, are skipped)
+    Defaults are 0 for numeric attributes and the first declared value for nominal ones (FALSE for booleans)
     """
-    
-    with codecs.open(train_file, "w") as train_out:
-        with codecs.open(test_file, "w") as test_out:
-            with codecs.open(gold_file, "w") as gold_out:
-                with codecs.open(origin_file, "w") as origin_out:
-
-                    for dataset in datasets:
-                        for label, line, features in dataset:
-                            for value, name, attribute_type in features:
-                                for out in [train_out, test_out]:
-                                    out.write("{0}\t".format(
-                                        # wapiti requires discrete features only
-                                        discretize_feature(averages, name, value) 
-                                    ))
-
-                            for out in [train_out, gold_out]:
-                                # writes label to train and gold
-                                out.write(label)
-
-                            # writes the original line
-                            origin_out.write(line)
-
-                            for out in [train_out, test_out, gold_out, origin_out]:
-                                # newline to all files
-                                out.write("\n")
-
-                        # (prevents multiple empty lines)
-                        if len(dataset) > 0:
-                            for out in [train_out, test_out, gold_out, origin_out]:
-                                # empty line in  between message sequences
-                                out.write("\n")
+
+    if len(dataset) == 0:
+        return
+
+    # (feature index, attribute index, attribute type, default value) of each declared attribute
+    attributes = []
+
+    for i, (raw_value, name, attribute_type) in enumerate(dataset[0][2]):
+        if attribute_type == "string":
+            continue
+
+        if attribute_type == "{TRUE, FALSE}":
+            default = False
+        elif attribute_type.startswith("{"):
+            default = attribute_type.strip("{}").split(",")[0].strip()
+        else:
+            default = 0
+
+        attributes.append((i, len(attributes), attribute_type, default))
+
+    rows = []
+
+    for label, line, features in dataset:
+        values = []
+
+        for i, attribute_index, attribute_type, default in attributes:
+            raw_value = features[i][0]
+
+            if raw_value != default:
+                if attribute_type == "{TRUE, FALSE}":
+                    values.append("{0} TRUE".format(attribute_index))
+                else:
+                    values.append("{0} {1}".format(attribute_index, raw_value))
+
+        if label != labels[0]:
+            values.append("{0} {1}".format(len(attributes), label))
+
+        rows.append("{" + ",".join(values) + "}\n")
+
+    out.write("".join(rows))
+
+
+def write_wapiti_dataset(
+    dataset, discrete_features, train_out, test_out, gold_out, origin_out, 
+    columns=None, symbol_table=None
+):
+    """
+    Writes the lines of a message and their discrete features (only the given columns, if any) to wapiti train, test, gold and origin files
+    Features are encoded as symbols if a symbol table is given, each file is written at once
+    """
+
+    train_rows, test_rows, gold_rows, origin_rows = [], [], [], []
+
+    for (label, line, features), line_discrete_features in zip(dataset, discrete_features):
+        if columns is not None:
+            line_discrete_features = [line_discrete_features[i] for i in columns]
+
+        if symbol_table is not None:
+            line_discrete_features = symbol_table.encode(line_discrete_features)
+
+        row = "".join(discrete_feature + "\t" for discrete_feature in line_discrete_features)
+
+        # label to train and gold, original line to origin
+        train_rows.append(row + label + "\n")
+        test_rows.append(row + "\n")
+        gold_rows.append(label + "\n")
+        origin_rows.append(line + "\n")
+
+    # (prevents multiple empty lines)
+    if len(dataset) > 0:
+        for rows in [train_rows, test_rows, gold_rows, origin_rows]:
+            # empty line in  between message sequences
+            rows.append("\n")
+
+    for out, rows in zip([train_out, test_out, gold_out, origin_out], [train_rows, test_rows, gold_rows, origin_rows]):
+        out.write("".join(rows))
 
 
 def make_syntactic_features(tokens_lemmas_tags):
@@ -324,16 +737,16 @@ def make_syntactic_features(tokens_lemmas_tags):
     return features
 
 
-def make_lexical_features(ngrams, line):
+def make_lexical_features(ngram_matcher, line):
     """
     Featurize the presence or absence of relevant ngrams
     """
 
+    matched = ngram_matcher.match(line)
+
     return [
-        (True, "ngram_{0}".format(i + 1), "{TRUE, FALSE}") 
-        if line.count(ngram) > 0 
-        else (False, "ngram_{0}".format(i + 1), "{TRUE, FALSE}") 
-        for i, ngram in enumerate(ngrams)
+        (i in matched, "ngram_{0}".format(i + 1), "{TRUE, FALSE}") 
+        for i in range(len(ngram_matcher.ngrams))
     ]
 
 
@@ -344,8 +757,8 @@ def make_stylistic_features(line, tokens, tags, line_number, total_lines):
 
     features = []
 
-    line_lower = line.lower()
-   
+    analysis = analyze_line(line, tokens)
+
     # position
     features.append((
         float(line_number) / total_lines, "position", "integer"
@@ -353,93 +766,82 @@ def make_stylistic_features(line, tokens, tags, line_number, total_lines):
 
     # number of tokens
     features.append((
-        len(tokens), "number_of_tokens", "integer"
+        analysis.number_of_tokens, "number_of_tokens", "integer"
     ))
 
     # number of chars
     features.append((
-        len(line), "number_of_chars", "integer"
+        analysis.number_of_chars, "number_of_chars", "integer"
     ))
 
     # number of quote symbols
     features.append((
-        line.count(">"), "number_of_quote_symbols", "integer"
+        analysis.number_of_quote_symbols, "number_of_quote_symbols", "integer"
     ))
 
     # average token length
     features.append((
-        sum(map(len, tokens)) / len(tokens), "average_token_length", "real"
+        analysis.token_length_sum / analysis.number_of_tokens, "average_token_length", "real"
     ))
 
     # proportion of uppercase chars
     features.append((
-        float(sum(x.isupper() for x in line)) / len(line), "proportion_of_uppercase_chars", "real"
+        float(analysis.number_of_uppercase_chars) / analysis.number_of_chars, "proportion_of_uppercase_chars", "real"
     ))
 
     # proportion of alphabetic chars
     features.append((
-        float(sum(x.isalpha() for x in line)) / len(line), "proportion_of_alphabetic_chars", "real"
+        float(analysis.number_of_alphabetic_chars) / analysis.number_of_chars, "proportion_of_alphabetic_chars", "real"
     ))
 
     # proportion of numeric chars
     features.append((
-        float(sum(x.isdigit() for x in line)) / len(line), "proportion_of_numeric_chars", "real"
+        float(analysis.number_of_numeric_chars) / analysis.number_of_chars, "proportion_of_numeric_chars", "real"
     ))
 
     # has question mark
     features.append((
-        line.count("?") > 0, "has_question_mark", "{TRUE, FALSE}"
+        analysis.has_question_mark, "has_question_mark", "{TRUE, FALSE}"
     ))
 
     # ends with question mark
     features.append((
-        line.endswith("?"), "ends_with_question_mark", "{TRUE, FALSE}"
+        analysis.ends_with_question_mark, "ends_with_question_mark", "{TRUE, FALSE}"
     ))
 
     # has colon
     features.append((
-        line.count(":") > 0, "has_colon", "{TRUE, FALSE}"
+        analysis.has_colon, "has_colon", "{TRUE, FALSE}"
     ))
 
     # ends with colon
     features.append((
-        line.endswith(":"), "ends_with_colon", "{TRUE, FALSE}"
+        analysis.ends_with_colon, "ends_with_colon", "{TRUE, FALSE}"
     ))
 
     # has semicolon
     features.append((
-        line.count(";") > 0, "has_semicolon", "{TRUE, FALSE}"
+        analysis.has_semicolon, "has_semicolon", "{TRUE, FALSE}"
     ))
 
     # ends with semicolon
     features.append((
-        line.endswith(";"), "ends_with_semicolon_mark", "{TRUE, FALSE}"
+        analysis.ends_with_semicolon, "ends_with_semicolon_mark", "{TRUE, FALSE}"
     ))
 
     # has early punctuation
-    first_punctuation_position = 999
-
-    for i, token in enumerate(tokens):
-        if token in [".", ";", ":", "?", "!", ","]:
-            first_punctuation_position = i
-
     features.append((
-        first_punctuation_position < 4, "has_early_punctuation", "{TRUE, FALSE}"
+        analysis.has_early_punctuation, "has_early_punctuation", "{TRUE, FALSE}"
     ))
 
     # has interrogating word
     features.append((
-        not set([token.lower() for token in tokens]).isdisjoint(
-            ["who", "when", "where", "what", "which", "what", "how"]
-        ), "has_interrogating_word", "{TRUE, FALSE}"
+        analysis.has_interrogating_word, "has_interrogating_word", "{TRUE, FALSE}"
     ))
 
     # starts with interrogating form
     features.append((
-        tokens[0].lower() in [
-            "who", "when", "where", "what", "which", "what", "how", 
-            "is", "are", "am", "will", "do", "does", "have", "has"
-        ], "starts_with_interrogating_form", "{TRUE, FALSE}"
+        analysis.starts_with_interrogating_form, "starts_with_interrogating_form", "{TRUE, FALSE}"
     ))
 
     # first verb form
@@ -455,126 +857,251 @@ def make_stylistic_features(line, tokens, tags, line_number, total_lines):
     ))
 
     # first personal pronoun
-    first_personal_pronoun = "NO_PERSONAL_PRONOUN"
-
-    for token in tokens:
-        if token.lower() in ["i", "you", "he", "she", "we", "they"]:
-            first_personal_pronoun = token.upper()
-
     features.append((
-        first_personal_pronoun, "first_personal_pronoun", "string"
+        analysis.personal_pronoun or "NO_PERSONAL_PRONOUN", "first_personal_pronoun", "string"
     ))
 
     # contains modal word
     features.append((
-        any(ngram in line_lower for ngram in [
-            "may", "must", "musn" "shall", "shan" "will", "might", "should", "would", "could"
-        ]), "contains_modal_word", "{TRUE, FALSE}"
+        analysis.contains_modal_word, "contains_modal_word", "{TRUE, FALSE}"
     ))
 
     # contains plan phrase
     features.append((
-        any(ngram in line_lower for ngram in [
-            "i will", "i am going to", "we will", "we are going to", "i plan to", "we plan to"
-        ]), "contains_plan_phrase", "{TRUE, FALSE}"
+        analysis.contains_plan_phrase, "contains_plan_phrase", "{TRUE, FALSE}"
     ))
 
     # contains first person mark
     features.append((
-        any(ngram in line_lower for ngram in [
-            "me", "us", "i", "we", "my", "mine", "myself", "ourselves"
-        ]), "contains_first_person_mark", "{TRUE, FALSE}"
+        analysis.contains_first_person_mark, "contains_first_person_mark", "{TRUE, FALSE}"
     ))
 
     # contains second person mark
     features.append((
-        any(ngram in line_lower for ngram in [
-            "you", "your", "yours", "yourself", "yourselves"
-        ]), "contains_second_person_mark", "{TRUE, FALSE}"
+        analysis.contains_second_person_mark, "contains_second_person_mark", "{TRUE, FALSE}"
     ))
 
     # contains third person mark
     features.append((
-        any(ngram in line_lower for ngram in [
-            "he", "she", "they", "his", "their", "hers", "him", "her", "them"
-        ]), "contains_third_person_mark", "{TRUE, FALSE}"
+        analysis.contains_third_person_mark, "contains_third_person_mark", "{TRUE, FALSE}"
     ))
 
     return features
 
 
+def collect_corpus_statistics(
+    folder, text_tiling_labels, filenames, numeric_feature_names, 
+    cache_folder=None, keep_parsed=True, vectorized=False
+):
+    """
+    Parse the given files once, computing stylistic features' sums and token counts along the way
+    Returns the compactly packed parsed files (None if not kept), the sums, the number of instances and the token counts
+    If vectorized, sums are computed from each file's numeric features matrix
+    """
+
+    parsed_files = [] if keep_parsed else None
+
+    stylistic_features_sums = {f:0.0 for f in numeric_feature_names}
+    instances = 0
+
+    vectorized_sums = np.zeros(len(NUMERIC_FEATURE_NAMES))
+
+    token_counts = Vocabulary().counts
+
+    progress = ProgressBar(maxval=len(filenames)).start()
+
+    for i, file_data in enumerate(parse_data_files(folder, text_tiling_labels, filenames, cache_folder=cache_folder)):
+        progress.update(i)
+
+        # counting the file's tokens at once
+        token_counts.add([token for line, tokens, label, tt_label, line_number, total_lines in file_data for token in tokens])
+
+        if vectorized:
+            vectorized_sums = accumulate_sums(vectorized_sums, measure_lines(file_data))
+            instances += len(file_data)
+
+        # updating stylistic features' sums
+        if not vectorized:
+            for line, tokens, label, tt_label, line_number, total_lines in file_data:
+                stylistic_features_sums, instances = update_stylistic_features_sums(
+                    stylistic_features_sums, instances, line, tokens, line_number, total_lines
+                )
+
+        if keep_parsed:
+            parsed_files.append(pack_parsed_file(file_data))
+
+    progress.finish()
+
+    if vectorized:
+        stylistic_features_sums.update(zip(NUMERIC_FEATURE_NAMES, vectorized_sums.tolist()))
+
+    return parsed_files, stylistic_features_sums, instances, token_counts
+
+
+def featurize_in_one_pass(
+    folder, text_tiling_labels, filenames, 
+    ngram_matcher, tag_cache, lemma_cache, occurrence_threshold_quotient,
+    cache_folder=None, buffer_size=ONE_PASS_BUFFER_SIZE, quartile_tiers=False
+):
+    """
+    Yields the featurized lines of each file along with their discrete features, reading the corpus once
+    Parsed files are buffered until they hold at least buffer_size lines, the buffer is then featurized and discretized
+    with the statistics of all the lines read so far (numeric features' averages or quartiles, token counts)
+    """
+
+    statistics = StreamingStatistics(NUMERIC_FEATURE_NAMES)
+
+    token_counts = Vocabulary().counts
+
+    buffered_files = []
+    buffered_lines = 0
+
+    progress = ProgressBar(maxval=len(filenames)).start()
+
+    for i, file_data in enumerate(parse_data_files(folder, text_tiling_labels, filenames, cache_folder=cache_folder)):
+        progress.update(i)
+
+        statistics.update(measure_lines(file_data))
+
+        token_counts.add([token for line, tokens, label, tt_label, line_number, total_lines in file_data for token in tokens])
+
+        buffered_files.append(file_data)
+        buffered_lines += len(file_data)
+
+        if buffered_lines >= buffer_size or i == len(filenames) - 1:
+            min_occurrences = token_counts.total * occurrence_threshold_quotient
+
+            # tokens with required frequency
+            relevant_vocabulary = token_counts.frequent_tokens(min_occurrences)
+
+            datasets = [
+                featurize_data_file(buffered_file, ngram_matcher, relevant_vocabulary, tag_cache, lemma_cache)
+                    for buffered_file in buffered_files
+            ]
+
+            for dataset_discrete_features in discretize_batch(
+                datasets, statistics.averages(), quartiles=statistics.quartiles() if quartile_tiers else None
+            ):
+                yield dataset_discrete_features
+
+            buffered_files = []
+            buffered_lines = 0
+
+    progress.finish()
+
+
+def pack_parsed_file(file_data):
+    """
+    Compact representation of a parsed file: tokens are dropped (they can be split from the line again)
+    and the total number of lines is only stored once
+    """
+
+    total_lines = file_data[0][5] if len(file_data) > 0 else 0
+
+    return total_lines, tuple(
+        (line, label, tt_label, line_number) for line, tokens, label, tt_label, line_number, total_lines in file_data
+    )
+
+
+def unpack_parsed_file(parsed_file):
+    """
+    Yield the lines of a packed parsed file in the format of parse_data_files
+    """
+
+    total_lines, lines = parsed_file
+
+    for line, label, tt_label, line_number in lines:
+        yield line, line.split()[1:], label, tt_label, line_number, total_lines
+
+
 def update_stylistic_features_sums(sums, instances, line, tokens, line_number, total_lines):
     """
     Update stylistic features' sums
     """
 
+    analysis = analyze_line(line, tokens)
+
     sums["position"] += float(line_number) / total_lines
-    sums["number_of_tokens"] += len(tokens)
-    sums["number_of_chars"] += len(line)
-    sums["number_of_quote_symbols"] += line.count(">")
-    sums["average_token_length"] += sum(map(len, tokens)) / len(tokens)
-    sums["proportion_of_uppercase_chars"] += float(sum(char.isupper() for char in line)) / len(line)
-    sums["proportion_of_alphabetic_chars"] += float(sum(char.isalpha() for char in line)) / len(line)
-    sums["proportion_of_numeric_chars"] += float(sum(char.isdigit() for char in line)) / len(line)
+    sums["number_of_tokens"] += analysis.number_of_tokens
+    sums["number_of_chars"] += analysis.number_of_chars
+    sums["number_of_quote_symbols"] += analysis.number_of_quote_symbols
+    sums["average_token_length"] += analysis.token_length_sum / analysis.number_of_tokens
+    sums["proportion_of_uppercase_chars"] += float(analysis.number_of_uppercase_chars) / analysis.number_of_chars
+    sums["proportion_of_alphabetic_chars"] += float(analysis.number_of_alphabetic_chars) / analysis.number_of_chars
+    sums["proportion_of_numeric_chars"] += float(analysis.number_of_numeric_chars) / analysis.number_of_chars
 
     return sums, instances + 1
 
 
-def update_token_count(counter, total, tokens):
+def parse_data_files(folder, text_tiling_labels, filenames, cache_folder=None):
     """
-    Updates a dictionary of token counts
+    Yields tokens, line number and total number of lines for each file in the given set 
+    If a cache folder is given, files whose content was already parsed are read from the cache instead
     """
 
-    for token in tokens:
-        token_lower = token.lower()
-        counter[token_lower] = counter[token_lower] + 1 if token_lower in counter else 1
+    for filename in filenames:
+        tt_labels = text_tiling_labels.labels(filename)
 
-    return counter, total + len(tokens)
+        if not cache_folder:
+            yield parse_data_file(codecs.open(folder + filename, "r").readlines(), tt_labels)
 
+            continue
 
-def parse_data_files(folder, text_tiling_folder, filenames):
-    """
-    Returns tokens, line number and total number of lines for each file in the given set 
-    """
+        with open(folder + filename, "rb") as data_file:
+            data = data_file.read()
 
-    data = []
+        path = cache_path(cache_folder, parsed_file_key(data, tt_labels))
 
-    for filename in filenames:
-        line_data = []
+        line_data = read_parsed_file(path) if os.path.exists(path) else None
+
+        if line_data is None:
+            lines = BytesIO(data).readlines()
 
-        lines = codecs.open(folder + filename, "r").readlines()
-        tt_lines = codecs.open(text_tiling_folder + filename, "r").readlines()
+            line_data = parse_data_file(lines, tt_labels)
 
-        line_number = 0 # position of the line in the message
+            if is_cacheable(line_data):
+                write_parsed_file(path, line_data, compute_lines_length(lines, ignore_empty=True))
 
-        for raw_line in lines:
-            line = raw_line.strip()
-            tokens = line.split()
+        yield line_data
 
-            if len(tokens) > 0 and tokens[0] == "#":
-                continue # ignore comments
 
-            line_number += 1 # comments don't count towards line number, but empty lines do
+def parse_data_file(lines, tt_labels):
+    """
+    Returns tokens, line number and total number of lines for each line of a file
+    """
 
-            if len(tokens) < 2:
-                continue # ignore empty lines
+    line_data = []
 
-            # original labels: "B", "BE", "I" or "E" (BIO)
-            raw_label = tokens.pop(0)
+    line_number = 0 # position of the line in the message
 
-            # binary labels: "T" or "F" (isBoundary)
-            label = "T" if raw_label == "B" or raw_label == "BE" else "F"
+    total_lines = compute_lines_length(lines, ignore_empty=True)
 
-            # Text Tiling labels: "S", "O" (isBoundary)
-            tt_label = tt_lines[line_number - 1].strip().split().pop(0) if line_number - 1 < len(tt_lines) else "O"
+    for raw_line in lines:
+        line = raw_line.strip()
+        tokens = line.split()
 
-            line_data.append((
-                line, tokens, label, tt_label, line_number, compute_file_length(folder + filename, ignore_empty=True)
-            ))
+        if len(tokens) > 0 and tokens[0] == "#":
+            continue # ignore comments
+
+        line_number += 1 # comments don't count towards line number, but empty lines do
+
+        if len(tokens) < 2:
+            continue # ignore empty lines
+
+        # original labels: "B", "BE", "I" or "E" (BIO)
+        raw_label = tokens.pop(0)
 
-        data.append(line_data)
+        # binary labels: "T" or "F" (isBoundary)
+        label = "T" if raw_label == "B" or raw_label == "BE" else "F"
 
-    return data
+        # Text Tiling labels: "S", "O" (isBoundary)
+        tt_label = tt_labels[line_number - 1] if line_number - 1 < len(tt_labels) else "O"
+
+        line_data.append((
+            line, tokens, label, tt_label, line_number, total_lines
+        ))
+
+    return line_data
 
 
 def discretize_feature(averages, name, value):
@@ -604,71 +1131,115 @@ def discretize_feature(averages, name, value):
     return discrete_feature.replace("#", "\\#")
 
 
-def compute_max_file_length(paths):
+def discretize_datasets(datasets, averages, vectorized=False, batch_size=10000):
     """
-    Return the integer sum of average length and standard length deviation for the given files
+    Yields each dataset along with the discrete features of its lines
+    If vectorized, numeric features are discretized with array operations, by batches of at least batch_size lines
     """
 
-    file_lengths = [compute_file_length(path) for path in paths]
+    if not vectorized:
+        for dataset in datasets:
+            yield dataset, [
+                # wapiti requires discrete features only
+                [discretize_feature(averages, name, value) for value, name, attribute_type in features]
+                    for label, line, features in dataset
+            ]
 
-    return int(math.ceil(
-        average(file_lengths) + standard_deviation(file_lengths)
-    ))
+        return
 
+    batch = []
+    batch_lines = 0
 
-def select_data_files(
-    folder, filenames, 
-    limit=-1,
-    max_file_length=False, 
-    only_initial=False, only_utf8=False, only_text_plain=False
-):
+    for dataset in datasets:
+        batch.append(dataset)
+        batch_lines += len(dataset)
+
+        if batch_lines >= batch_size:
+            for dataset_discrete_features in discretize_batch(batch, averages):
+                yield dataset_discrete_features
+
+            batch = []
+            batch_lines = 0
+
+    for dataset_discrete_features in discretize_batch(batch, averages):
+        yield dataset_discrete_features
+
+
+def discretize_batch(datasets, averages, quartiles=None):
     """
-    Select relevant email files from the corpus
+    Returns each dataset along with the discrete features of its lines, numeric features being discretized all at once
+    All lines are expected to have the same features, in the same order
+    If quartiles are given, numeric features are discretized by quartile instead of relatively to their average
     """
 
-    selection = []
+    lines = [features for dataset in datasets for label, line, features in dataset]
 
-    max_selection_length = len(filenames) if len(filenames) < limit and limit >= 0 else limit
-    
-    progress = ProgressBar(maxval=max_selection_length)
+    if len(lines) == 0:
+        return [(dataset, []) for dataset in datasets]
 
-    for filename in progress(filenames):
-        if len(selection) == limit:
-            break
+    numeric_columns = [i for i, (value, name, attribute_type) in enumerate(lines[0]) if name in averages]
+    names = [lines[0][i][1] for i in numeric_columns]
+
+    values = np.array([[features[i][0] for i in numeric_columns] for features in lines], dtype=np.float64)
 
-        lines = codecs.open(folder + filename, "r").readlines()
+    if quartiles is not None:
+        tiers = discretize_quartiles(values, np.array([quartiles[name] for name in names]).reshape(-1, 3)).tolist()
+    else:
+        tiers = discretize_values(values, np.array([averages[name] for name in names])).tolist()
 
-        if max_file_length and len(lines) > max_file_length:
-            continue # skip lines in files that are too long (probable log or bash dump)
+    tokens = tier_tokens(names)
 
-        for line in lines:
-            if line.startswith("#"): # "#" prefixed lines contain metadata
-                metadata = line[2:].split("\t")
+    discrete_features = []
 
-                if len(metadata) == 8:
-                    # message_id = metadata[0]
-                    mime = metadata[1]
-                    encoding = metadata[2]
-                    is_initial = metadata[3]
-                    # from_address = metadata[4]
-                    # from_personal = metadata[5]
-                    # to_address = metadata[6]
-                    # to_personal = metadata[7]
+    for features, line_tiers in zip(lines, tiers):
+        line_discrete_features = [
+            None if name in averages else discretize_feature(averages, name, value)
+                for value, name, attribute_type in features
+        ]
 
-                    if (
-                        (is_initial != "true" and only_initial)
-                        or (encoding != "UTF-8" and only_utf8)
-                        or (mime != "text/plain" and only_text_plain)
-                    ):
-                        break # this file is not in scope
+        for column, (i, tier) in enumerate(zip(numeric_columns, line_tiers)):
+            line_discrete_features[i] = tokens[column][tier]
 
-                    selection.append(filename)
+        discrete_features.append(line_discrete_features)
 
-                    break # all necessary metadata has been gathered for this file
-            else:
-                break # there should be no more metadata in the file
+    datasets_discrete_features = []
+    start = 0
+
+    for dataset in datasets:
+        datasets_discrete_features.append((dataset, discrete_features[start:start + len(dataset)]))
+        start += len(dataset)
 
-    return selection
+    return datasets_discrete_features
+
+
+def compute_max_file_length(manifest, filenames):
+    """
+    Return the integer sum of average length and standard length deviation for the given files
+    """
+
+    file_lengths = [manifest[filename].body_line_count for filename in filenames]
+
+    return int(math.ceil(
+        average(file_lengths) + standard_deviation(file_lengths)
+    ))
+
+
+def select_data_files(
+    manifest, filenames, 
+    limit=-1,
+    max_file_length=False, 
+    only_initial=False, only_utf8=False, only_text_plain=False
+):
+    """
+    Select relevant email files from the corpus manifest
+    """
+
+    return query_manifest(
+        manifest, filenames,
+        limit=limit,
+        max_line_count=max_file_length, # skip files that are too long (probable log or bash dump)
+        only_initial=only_initial, only_utf8=only_utf8, only_text_plain=only_text_plain
+    )
 
 
 def parse_args():
@@ -734,6 +1305,133 @@ def parse_args():
         type="string",
         help="path to the ngrams file")
 
+    op.add_option("--parse_cache_folder",
+        dest="parse_cache_folder",
+        default=PARSE_CACHE_FOLDER,
+        type="string",
+        help="path to the parsed files cache folder")
+
+    op.add_option("--no_cache",
+        dest="no_cache",
+        default=False,
+        action="store_true",
+        help="always parse, tag and lemmatize source files, without reading or writing the parsed files, tags and lemmas caches")
+
+    op.add_option("--tag_cache_file",
+        dest="tag_cache_file",
+        default=TAG_CACHE_FILE,
+        type="string",
+        help="path to the part-of-speech tags cache")
+
+    op.add_option("--lemma_cache_file",
+        dest="lemma_cache_file",
+        default=LEMMA_CACHE_FILE,
+        type="string",
+        help="path to the lemmas cache")
+
+    op.add_option("--text_tiling_store_file",
+        dest="text_tiling_store_file",
+        default=TT_STORE_FILE,
+        type="string",
+        help="path to the store of the corpus' text tiling labels")
+
+    op.add_option("--lemma_cache_size",
+        dest="lemma_cache_size",
+        default=LEMMA_CACHE_SIZE,
+        type="int",
+        help="maximum number of lemmas kept in memory (defaults to {0})".format(LEMMA_CACHE_SIZE))
+
+    op.add_option("--streaming",
+        dest="streaming",
+        default=False,
+        action="store_true",
+        help="bounded memory usage: parsed files are read again for featurization instead of being kept in memory")
+
+    op.add_option("-w", "--workers",
+        dest="workers",
+        default=1,
+        type="int",
+        help="number of worker processes used for feature extraction (defaults to 1)")
+
+    op.add_option("--feature_groups",
+        dest="feature_groups",
+        default=",".join(GROUPS),
+        type="string",
+        help="comma-separated feature groups written to wapiti datafiles (defaults to {0})".format(",".join(GROUPS)))
+
+    op.add_option("--encoded",
+        dest="encoded",
+        default=False,
+        action="store_true",
+        help="writes wapiti features as short symbols, whose values are stored in the symbols file (text tiling labels are kept as they are)")
+
+    op.add_option("--sparse_arff",
+        dest="sparse_arff",
+        default=False,
+        action="store_true",
+        help="writes a sparse Weka ARFF file, containing only non-default values")
+
+    op.add_option("--matrix",
+        dest="matrix_format",
+        default=None,
+        type="choice",
+        choices=MATRIX_FORMATS,
+        help="also writes features as a sparse matrix, with labels and message boundaries ({0})".format(", ".join(MATRIX_FORMATS)))
+
+    op.add_option("--incremental",
+        dest="incremental",
+        default=False,
+        action="store_true",
+        help="only builds the source files that are new since the previous incremental build, appending them to its outputs")
+
+    op.add_option("--build_state_file",
+        dest="build_state_file",
+        default=BUILD_STATE_FILE,
+        type="string",
+        help="path to the statistics and source files of the previous incremental build")
+
+    op.add_option("--rebuild",
+        dest="rebuild",
+        default=False,
+        action="store_true",
+        help="builds all source files again, with --incremental (when the previous build's thresholds drifted for instance)")
+
+    op.add_option("--drift_tolerance",
+        dest="drift_tolerance",
+        default=DRIFT_TOLERANCE,
+        type="float",
+        help="relative change of the corpus statistics above which a full rebuild is required, with --incremental (defaults to {0})".format(DRIFT_TOLERANCE))
+
+    op.add_option("--one_pass",
+        dest="one_pass",
+        default=False,
+        action="store_true",
+        help="reads the corpus once: features are discretized with the statistics of the lines read so far, a buffer of lines at a time")
+
+    op.add_option("--buffer_size",
+        dest="buffer_size",
+        default=ONE_PASS_BUFFER_SIZE,
+        type="int",
+        help="minimum number of lines featurized at once with --one_pass (defaults to {0})".format(ONE_PASS_BUFFER_SIZE))
+
+    op.add_option("--quartile_tiers",
+        dest="quartile_tiers",
+        default=False,
+        action="store_true",
+        help="discretizes numeric features by quartile (estimated with streaming sketches) instead of relatively to their average, with --one_pass")
+
+    op.add_option("--vectorized",
+        dest="vectorized",
+        default=False,
+        action="store_true",
+        help="computes the sums and discrete tiers of numeric stylistic features with numpy array operations")
+
+    op.add_option("--manifest_file",
+        dest="manifest_file",
+        default=MANIFEST_FILE,
+        type="string",
+        help="path to the corpus manifest (created if missing, refreshed incrementally)")
+
     ########################################
 
     op.add_option("--wapiti_train_file",
@@ -762,12 +1460,36 @@ def parse_args():
 
     ########################################
 
+    op.add_option("--wapiti_schema_file",
+        dest="wapiti_schema_file",
+        default=WAPITI_SCHEMA_FILE,
+        type="string",
+        help="output wapiti datafiles' schema")
+
+    op.add_option("--wapiti_symbols_file",
+        dest="wapiti_symbols_file",
+        default=WAPITI_SYMBOLS_FILE,
+        type="string",
+        help="output symbols file (used with --encoded)")
+
+    op.add_option("--vocabulary_file",
+        dest="vocabulary_file",
+        default=None,
+        type="string",
+        help="output vocabulary file: tokens of the built source files and their number of occurrences")
+
     op.add_option("--weka_arff_file",
         dest="weka_arff_file",
         default=WEKA_ARFF_FILE,
         type="string",
         help="output weka arff file")
 
+    op.add_option("--matrix_file",
+        dest="matrix_file",
+        default=MATRIX_FILE,
+        type="string",
+        help="output sparse matrix file, without extension (used with --matrix)")
+
     ########################################
 
     op.add_option("--test",
@@ -778,7 +1500,27 @@ def parse_args():
 
     ########################################
 
-    return op.parse_args()
+    opts, args = op.parse_args()
+
+    opts.feature_groups = [group.strip() for group in opts.feature_groups.split(",") if group.strip()]
+
+    for group in opts.feature_groups:
+        if group not in GROUPS:
+            op.error("unknown feature group \"{0}\" (available groups: {1})".format(group, ", ".join(GROUPS)))
+
+    if opts.one_pass and opts.workers > 1:
+        op.error("--one_pass featurizes files in a single process, it cannot be used with --workers")
+
+    if opts.incremental and (opts.one_pass or opts.matrix_format):
+        op.error("--incremental cannot be used with --one_pass or --matrix")
+
+    if opts.rebuild and not opts.incremental:
+        op.error("--rebuild requires --incremental")
+
+    if opts.quartile_tiers and not opts.one_pass:
+        op.error("--quartile_tiers requires --one_pass")
+
+    return opts, args
 
 
 if __name__ == "__main__":
@@ -792,6 +1534,9 @@ if __name__ == "__main__":
     if not options.text_tiling_folder.endswith("/"):
         options.text_tiling_folder += "/"
 
+    if not options.parse_cache_folder.endswith("/"):
+        options.parse_cache_folder += "/"
+
     ########################################
 
     if options.test:
@@ -0,0 +1,150 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+:Name:
+    feature_schema.py
+
+:Authors:
+    Soufian Salim (soufi@nsal.im)
+"""
+
+import codecs
+import json
+import os
+
+
+# feature groups, in the order of their columns in wapiti datafiles
+GROUPS = ["syntactic", "stylistic", "lexical", "thematic"]
+
+# syntactic (hinge) features: forms of the first and last three tokens of a line
+HINGE_POSITIONS = [0, 1, 2, -3, -2, -1]
+HINGE_FORMS = ["token", "lemma", "tag"]
+
+# numeric features are discretized into tiers (low, high, highest, lowest)
+NUMERIC_TIERS = 4
+
+
+def hinge_feature_name(position, form):
+    """
+    Name of the syntactic feature for a token position and a form
+    """
+
+    return "hinge_{0}_{1}".format(position, form)
+
+
+def attribute_cardinality(attribute_type):
+    """
+    Number of distinct values of a column given its (Weka-style) attribute type, None for open vocabularies
+    """
+
+    if attribute_type.startswith("{"):
+        return len(attribute_type.strip("{}").split(","))
+    elif attribute_type in ["integer", "real"]:
+        return NUMERIC_TIERS
+
+    return None
+
+
+def make_schema(groups, labels):
+    """
+    Build a schema from (group name, [(feature name, attribute type), ...]) pairs, in column order
+    """
+
+    return {
+        "groups": [
+            {
+                "name": group,
+                "columns": [
+                    {"name": name, "type": attribute_type, "cardinality": attribute_cardinality(attribute_type)}
+                        for name, attribute_type in columns
+                ]
+            } for group, columns in groups
+        ],
+        "labels": labels
+    }
+
+
+def schema_columns(schema, groups=None):
+    """
+    Yields the column index, group name and description of each column of the schema (restricted to the given groups)
+    """
+
+    i = 0
+
+    for group in schema["groups"]:
+        for column in group["columns"]:
+            if groups is None or group["name"] in groups:
+                yield i, group["name"], column
+
+            i += 1
+
+
+def project_schema(schema, groups):
+    """
+    Returns the schema restricted to the given groups, and the indexes of the kept columns in the original schema
+    """
+
+    projected_schema = dict(schema, groups=[group for group in schema["groups"] if group["name"] in groups])
+    kept_columns = [i for i, group, column in schema_columns(schema, groups)]
+
+    return projected_schema, kept_columns
+
+
+def save_schema(schema, path):
+    """
+    Write a schema as JSON
+    """
+
+    folder = os.path.dirname(path)
+
+    if folder and not os.path.exists(folder):
+        os.makedirs(folder)
+
+    with codecs.open(path, "w") as out:
+        json.dump(schema, out, indent=2, separators=(",", ": "), sort_keys=True)
+        out.write("\n")
+
+
+def load_schema(path):
+    """
+    Read a schema written by save_schema
+    """
+
+    with codecs.open(path, "r") as schema_file:
+        return json.load(schema_file)
+
+
+def write_patterns(out, schema, offsets, groups, start=1):
+    """
+    Write wapiti patterns for the columns of the given groups present in the schema, returns the number of the next pattern
+    Syntactic columns are combined into unigrams, bigrams and trigrams of consecutive hinge positions, other columns are unigrams
+    """
+
+    indexes = {column["name"]: i for i, group, column in schema_columns(schema)}
+    present_groups = set(group["name"] for group in schema["groups"])
+
+    i = start
+
+    for offset in offsets:
+        x = str(offset) if offset < 1 else "+" + str(offset)
+
+        if "syntactic" in groups and "syntactic" in present_groups:
+            for positions in [HINGE_POSITIONS[:3], HINGE_POSITIONS[3:]]:
+                for form in HINGE_FORMS:
+                    y = [indexes[hinge_feature_name(position, form)] for position in positions]
+
+                    # unigrams, bigrams and trigram
+                    for columns in [y[0:1], y[1:2], y[2:3], y[0:2], y[1:3], y]:
+                        out.write("*{0}:{1}\n".format(i, "/".join("%x[{0},{1}]".format(x, column) for column in columns)))
+                        i += 1
+
+                out.write("\n")
+
+        for y, group, column in schema_columns(schema, [group for group in groups if group != "syntactic"]):
+            out.write("*{0}:%x[{1},{2}]\n".format(i, x, y))
+            i += 1
+
+        out.write("\n")
+
+    return i
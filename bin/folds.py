@@ -0,0 +1,108 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+:Name:
+    folds.py
+
+:Authors:
+    Soufian Salim (soufi@nsal.im)
+"""
+
+import hashlib
+
+
+class FileList(list):
+    """
+    Filenames in corpus order, with constant-time membership tests (the list is not meant to be modified)
+    """
+
+    def __init__(self, filenames=()):
+        list.__init__(self, filenames)
+
+        self.members = frozenset(self)
+
+    def __contains__(self, filename):
+        return filename in self.members
+
+
+class FoldAssignment(object):
+    """
+    Assigns messages to folds by a stable hash of their message id (of their filename if they have none)
+    A message's fold depends neither on the listing order of the data folder nor on the other messages,
+    so assignments are kept as the corpus grows and messages sharing a message id always end up in the same fold
+    If hashing leaves a fold empty (small corpora), message ids sorted by hash are dealt to the folds in turn instead,
+    which is still independent of the listing order but not stable as the corpus grows
+    """
+
+    def __init__(self, manifest, filenames, folds):
+        self.filenames = filenames
+        self.folds = folds
+
+        keys = dict((filename, message_key(manifest[filename])) for filename in filenames)
+        hashes = dict((key, fold_hash(key)) for key in keys.itervalues())
+
+        folds_of = dict((key, key_hash % folds) for key, key_hash in hashes.iteritems()) # message key => fold
+
+        self.round_robin = len(set(folds_of.itervalues())) < min(folds, len(hashes))
+
+        if self.round_robin:
+            folds_of = dict((key, i % folds) for i, key in enumerate(sorted(hashes, key=lambda key: (hashes[key], key))))
+
+        self.assignments = dict((filename, folds_of[key]) for filename, key in keys.iteritems()) # filename => fold
+
+    def fold(self, filename):
+        """
+        Index of the fold a message is held out in
+        """
+
+        return self.assignments[filename]
+
+    def sizes(self):
+        """
+        Number of messages held out in each fold
+        """
+
+        sizes = [0] * self.folds
+
+        for fold in self.assignments.itervalues():
+            sizes[fold] += 1
+
+        return sizes
+
+    def split(self, k):
+        """
+        Returns the training files and the held out files of a fold, in corpus order
+        """
+
+        train = FileList(filename for filename in self.filenames if self.assignments[filename] != k)
+        test = FileList(filename for filename in self.filenames if self.assignments[filename] == k)
+
+        return train, test
+
+
+def hash_order(manifest, filenames):
+    """
+    Sorts filenames by the hash of their message key, so that taking the first n of them does not depend on the listing order
+    """
+
+    return sorted(filenames, key=lambda filename: (fold_hash(message_key(manifest[filename])), filename))
+
+
+def message_key(record):
+    """
+    Key a message is assigned to a fold by
+    """
+
+    return record.message_id if record.message_id else record.filename
+
+
+def fold_hash(key):
+    """
+    Hash of a key that does not change between runs and platforms (unlike hash())
+    """
+
+    if isinstance(key, unicode):
+        key = key.encode("utf-8")
+
+    return int(hashlib.sha1(key).hexdigest()[:8], 16)
@@ -0,0 +1,272 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+:Name:
+    labelling_worker.py
+
+:Authors:
+    Soufian Salim (soufi@nsal.im)
+"""
+
+import os
+import socket
+import subprocess
+import sys
+import threading
+
+from distutils.spawn import find_executable
+from optparse import OptionParser
+from SocketServer import StreamRequestHandler, ThreadingMixIn, UnixStreamServer
+from utility import timed_print
+from wapiti import WAPITI
+
+
+# wapiti's output is block-buffered when it is piped, stdbuf makes it flush each labelled line
+LINE_BUFFERED = ["stdbuf", "-oL"] if find_executable("stdbuf") else []
+
+# protocol (over a pipe or a local socket): a request is a message's featurized observations, one per line, ending with an empty line
+# the response is a "# score" line, a "label<tab>probability" line per observation and an empty line ("! error" if the request failed)
+ERROR_PREFIX = "! "
+
+
+class LabellingWorker(object):
+    """
+    Resident "wapiti label" process, which keeps its model loaded between messages
+    Messages are labelled one at a time, in the order they are submitted (the worker can be shared by threads)
+    """
+
+    def __init__(self, model_file, executable=WAPITI):
+        self.model_file = model_file
+
+        self.process = subprocess.Popen(
+            LINE_BUFFERED + [executable, "label", "-m", model_file, "-s", "-p"],
+            stdin=subprocess.PIPE, stdout=subprocess.PIPE
+        )
+
+        self.lock = threading.Lock()
+
+    def label(self, observations):
+        """
+        Returns the score of a message's labelling and the label and probability of each of its observations (datafile rows)
+        """
+
+        if len(observations) == 0:
+            return None, [] # wapiti outputs nothing for empty sequences
+
+        with self.lock:
+            for observation in observations:
+                self.process.stdin.write(observation.rstrip("\n") + "\n")
+
+            self.process.stdin.write("\n")
+            self.process.stdin.flush()
+
+            lines = []
+
+            for line in iter(self.process.stdout.readline, ""):
+                if line.strip() == "":
+                    if len(lines) > 0:
+                        break
+
+                    continue # blank lines separating sequences
+
+                lines.append(line.rstrip("\n"))
+            else:
+                raise IOError("wapiti ended while labelling (exit status {0})".format(self.process.wait()))
+
+        return parse_labelling(lines)
+
+    def close(self):
+        """
+        Ends the wapiti process
+        """
+
+        self.process.stdin.close()
+        self.process.wait()
+
+
+class LabellingClient(object):
+    """
+    Client of a labelling worker served on a local socket, with the same interface as the worker
+    """
+
+    def __init__(self, socket_file):
+        self.connection = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.connection.connect(socket_file)
+
+        self.reader = self.connection.makefile("rb")
+        self.writer = self.connection.makefile("wb")
+
+    def label(self, observations):
+        """
+        Returns the score of a message's labelling and the label and probability of each of its observations (datafile rows)
+        """
+
+        if len(observations) == 0:
+            return None, []
+
+        self.writer.write("".join(observation.rstrip("\n") + "\n" for observation in observations) + "\n")
+        self.writer.flush()
+
+        lines = []
+
+        for line in iter(self.reader.readline, ""):
+            if line.strip() == "":
+                break
+
+            lines.append(line.rstrip("\n"))
+        else:
+            raise IOError("labelling worker closed the connection")
+
+        if len(lines) > 0 and lines[0].startswith(ERROR_PREFIX):
+            raise IOError("labelling worker: {0}".format(lines[0][len(ERROR_PREFIX):]))
+
+        score = float(lines[0][2:]) if len(lines) > 0 and lines[0].startswith("# ") else None
+
+        labels = [line.split("\t") for line in lines if not line.startswith("#")]
+
+        return score, [(label, float(probability)) for label, probability in labels]
+
+    def close(self):
+        """
+        Closes the connection
+        """
+
+        self.writer.close()
+        self.reader.close()
+        self.connection.close()
+
+
+class LabellingServer(ThreadingMixIn, UnixStreamServer):
+    """
+    Serves a labelling worker on a local socket, each connection being handled by a thread
+    """
+
+    daemon_threads = True
+
+    def __init__(self, socket_file, worker):
+        if os.path.exists(socket_file):
+            os.remove(socket_file) # left by a previous server
+
+        UnixStreamServer.__init__(self, socket_file, LabellingRequestHandler)
+
+        self.worker = worker
+
+
+class LabellingRequestHandler(StreamRequestHandler):
+    """
+    Labels the messages sent on a connection
+    """
+
+    def handle(self):
+        serve_stream(self.server.worker, self.rfile, self.wfile)
+
+
+def serve_stream(worker, requests, responses):
+    """
+    Answers the requests read from a stream until it ends
+    """
+
+    observations = []
+
+    for line in iter(requests.readline, ""):
+        if line.strip() != "":
+            observations.append(line)
+
+            continue
+
+        if len(observations) == 0:
+            continue
+
+        try:
+            score, labels = worker.label(observations)
+
+            responses.write("# {0}\n".format(score))
+
+            for label, probability in labels:
+                responses.write("{0}\t{1}\n".format(label, probability))
+        except (IOError, ValueError) as e:
+            responses.write("{0}{1}\n".format(ERROR_PREFIX, e))
+
+        responses.write("\n")
+        responses.flush()
+
+        observations = []
+
+
+def parse_labelling(lines):
+    """
+    Returns the sequence score and the (label, probability) pairs of wapiti's output for a message
+    ("# n-best index score" then "columns... label/probability")
+    """
+
+    score = None
+    labels = []
+
+    for line in lines:
+        if line.startswith("#"):
+            score = float(line[1:].split()[-1]) # the score comes after the index of the n-best sequence
+
+            continue
+
+        label, probability = line.rsplit("\t", 1)[-1].rsplit("/", 1)
+
+        labels.append((label, float(probability)))
+
+    return score, labels
+
+
+def parse_args():
+    """
+    Parse command line opts and arguments
+    """
+
+    op = OptionParser(usage="usage: %prog [opts]")
+
+    op.add_option("-m", "--model_file",
+        dest="model_file",
+        type="string",
+        help="wapiti model used to label messages")
+
+    op.add_option("-s", "--socket_file",
+        dest="socket_file",
+        default=None,
+        type="string",
+        help="local socket on which messages are received (defaults to stdin and stdout)")
+
+    op.add_option("--executable",
+        dest="executable",
+        default=WAPITI,
+        type="string",
+        help="path to the wapiti executable")
+
+    opts, args = op.parse_args()
+
+    if not opts.model_file:
+        op.error("missing model file (-m)")
+
+    return opts, args
+
+
+if __name__ == "__main__":
+    options, arguments = parse_args()
+
+    labelling_worker = LabellingWorker(options.model_file, executable=options.executable)
+
+    try:
+        if options.socket_file:
+            server = LabellingServer(options.socket_file, labelling_worker)
+
+            timed_print("labelling messages sent to {0}...".format(options.socket_file))
+
+            try:
+                server.serve_forever()
+            except KeyboardInterrupt:
+                pass
+            finally:
+                server.server_close()
+                os.remove(options.socket_file)
+        else:
+            serve_stream(labelling_worker, sys.stdin, sys.stdout)
+    finally:
+        labelling_worker.close()
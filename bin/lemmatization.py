@@ -0,0 +1,146 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+:Name:
+    lemmatization.py
+
+:Authors:
+    Soufian Salim (soufi@nsal.im)
+"""
+
+import cPickle
+import os
+
+from collections import OrderedDict
+from nltk.stem.wordnet import WordNetLemmatizer
+
+
+def coarse_pos(tag):
+    """
+    WordNet part-of-speech of a Penn Treebank tag, as used for lemmatization ("v" for verbs, "n" otherwise)
+    """
+
+    return "v" if tag.startswith("V") else "n"
+
+
+class LemmaCache(object):
+    """
+    Memoized lemmatization keyed by (normalized token, coarse part-of-speech)
+    Entries are kept in a bounded LRU, which can be saved to disk and warmed up from a previous run
+    """
+
+    def __init__(self, max_size=100000, path=None, lemmatizer=None):
+        self.max_size = max_size
+        self.path = path
+        self.lemmatizer = lemmatizer or WordNetLemmatizer()
+
+        self.entries = OrderedDict() # least recently used first
+        self.added = {} # entries lemmatized since the last call to pop_changes
+        self.modified = False
+
+        self.hits = self.misses = 0 # since the cache was created
+        self.new_hits = self.new_misses = 0 # since the last call to pop_changes
+
+        if path and os.path.exists(path):
+            with open(path, "rb") as cache_file:
+                for key, lemma in cPickle.load(cache_file)[-max_size:]:
+                    self.entries[key] = lemma
+
+    def lemmatize(self, token, pos="n"):
+        """
+        Returns the lemma of a token, in the format of WordNetLemmatizer.lemmatize
+        """
+
+        key = (token, pos)
+
+        if key in self.entries:
+            lemma = self.entries.pop(key) # re-inserted as the most recently used entry
+
+            self.hits += 1
+            self.new_hits += 1
+        else:
+            lemma = self.lemmatizer.lemmatize(token, pos)
+
+            self.added[key] = lemma
+            self.modified = True
+
+            self.misses += 1
+            self.new_misses += 1
+
+        self.entries[key] = lemma
+
+        if len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+
+        return lemma
+
+    def hit_rate(self):
+        """
+        Proportion of lookups answered from the cache
+        """
+
+        lookups = self.hits + self.misses
+
+        return float(self.hits) / lookups if lookups > 0 else 0.0
+
+    def pop_changes(self):
+        """
+        Returns and forgets the entries and counters changed since the last call
+        """
+
+        changes = self.added, self.new_hits, self.new_misses
+
+        self.added = {}
+        self.new_hits = self.new_misses = 0
+
+        return changes
+
+    def merge_changes(self, changes):
+        """
+        Add entries and counters from another cache (in another process for instance)
+        """
+
+        added, hits, misses = changes
+
+        for key, lemma in added.iteritems():
+            self.entries[key] = lemma
+
+        while len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+
+        self.hits += hits
+        self.misses += misses
+
+        self.modified = self.modified or len(added) > 0
+
+    def save(self, path=None):
+        """
+        Write the cache's entries to disk, if new entries were lemmatized since it was loaded
+        """
+
+        path = path or self.path
+
+        if not path or not self.modified:
+            return
+
+        folder = os.path.dirname(path)
+
+        if folder and not os.path.exists(folder):
+            os.makedirs(folder)
+
+        temporary_path = "{0}.{1}.tmp".format(path, os.getpid())
+
+        with open(temporary_path, "wb") as out:
+            cPickle.dump(self.entries.items(), out, cPickle.HIGHEST_PROTOCOL)
+
+        os.rename(temporary_path, path)
+
+        self.modified = False
+
+    def statistics(self):
+        """
+        Human-readable hit rate
+        """
+
+        return "{0} hits, {1} misses ({2:.2f}% hit rate)".format(self.hits, self.misses, self.hit_rate() * 100)
@@ -0,0 +1,210 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+:Name:
+    manifest.py
+
+:Authors:
+    Soufian Salim (soufi@nsal.im)
+"""
+
+import codecs
+import os
+
+from collections import namedtuple
+from progressbar import ProgressBar
+from utility import timed_print
+
+
+# one record per tagged email file
+ManifestRecord = namedtuple("ManifestRecord", [
+    "filename",
+    "message_id",
+    "mime",
+    "encoding",
+    "is_initial",
+    "from_address",
+    "to_address",
+    "line_count", # total number of lines, metadata included
+    "body_line_count", # lines that are not metadata
+    "non_empty_line_count", # lines that are neither metadata nor empty
+    "size",
+    "mtime"
+])
+
+# the first integer field of a record (everything before is a string)
+FIRST_INTEGER_FIELD = ManifestRecord._fields.index("line_count")
+
+
+def load_manifest(path):
+    """
+    Load a manifest from a tab-separated file, returns an empty manifest if the file does not exist
+    """
+
+    manifest = {}
+
+    if not os.path.exists(path):
+        return manifest
+
+    with codecs.open(path, "r") as manifest_file:
+        for raw_line in manifest_file:
+            fields = raw_line.rstrip("\n").split("\t")
+
+            if len(fields) != len(ManifestRecord._fields):
+                continue # corrupted or outdated record, the file will be rescanned
+
+            record = ManifestRecord(*(
+                fields[:FIRST_INTEGER_FIELD]
+                + [int(field) for field in fields[FIRST_INTEGER_FIELD:-1]]
+                + [float(fields[-1])]
+            ))
+
+            manifest[record.filename] = record
+
+    return manifest
+
+
+def save_manifest(manifest, path, filenames=None):
+    """
+    Write a manifest to a tab-separated file, in the given filename order if any
+    """
+
+    folder = os.path.dirname(path)
+
+    if folder and not os.path.exists(folder):
+        os.makedirs(folder)
+
+    with codecs.open(path, "w") as out:
+        for filename in filenames if filenames is not None else sorted(manifest):
+            record = manifest[filename]
+
+            out.write("\t".join(str(field) for field in record[:-1]))
+            out.write("\t{0!r}".format(record.mtime)) # repr keeps the full mtime precision
+            out.write("\n")
+
+
+def refresh_manifest(manifest, folder):
+    """
+    Bring a manifest up to date with the folder's content, only rescanning files whose size or mtime changed
+    Returns the updated manifest, the folder's filenames (in listing order) and the number of rescanned files
+    """
+
+    filenames = os.listdir(folder)
+
+    refreshed = {}
+    rescanned = 0
+
+    progress = ProgressBar()
+
+    for filename in progress(filenames):
+        stat = os.stat(folder + filename)
+        record = manifest.get(filename)
+
+        if record is None or record.size != stat.st_size or record.mtime != stat.st_mtime:
+            record = scan_data_file(folder, filename, stat)
+            rescanned += 1
+
+        refreshed[filename] = record
+
+    return refreshed, filenames, rescanned
+
+
+def scan_data_file(folder, filename, stat=None):
+    """
+    Read a tagged email file's metadata header and count its lines
+    """
+
+    if stat is None:
+        stat = os.stat(folder + filename)
+
+    metadata = [""] * 8
+
+    line_count = body_line_count = non_empty_line_count = 0
+
+    in_header = True
+
+    for line in codecs.open(folder + filename, "r"):
+        line_count += 1
+
+        if line.startswith("#"): # "#" prefixed lines contain metadata
+            if in_header:
+                fields = line[2:].rstrip("\n").split("\t")
+
+                if len(fields) == 8:
+                    metadata = fields
+                    in_header = False # all necessary metadata has been gathered for this file
+
+            continue
+
+        in_header = False # there should be no more metadata in the file
+
+        body_line_count += 1
+
+        if len(line.strip()) > 1:
+            non_empty_line_count += 1
+
+    message_id, mime, encoding, is_initial, from_address, from_personal, to_address, to_personal = metadata
+
+    return ManifestRecord(
+        filename,
+        message_id, mime, encoding, is_initial, from_address, to_address,
+        line_count, body_line_count, non_empty_line_count,
+        stat.st_size, stat.st_mtime
+    )
+
+
+def update_manifest(folder, path):
+    """
+    Load, refresh and save the manifest of a data folder
+    Returns the manifest and the folder's filenames (in listing order)
+    """
+
+    timed_print("refreshing corpus manifest...")
+
+    previous_manifest = load_manifest(path)
+
+    manifest, filenames, rescanned = refresh_manifest(previous_manifest, folder)
+
+    print("# {0} files indexed, {1} (re)scanned".format(len(filenames), rescanned))
+
+    if rescanned > 0 or len(previous_manifest) != len(manifest):
+        save_manifest(manifest, path, filenames=filenames)
+
+    return manifest, filenames
+
+
+def query_manifest(
+    manifest, filenames,
+    limit=-1,
+    max_line_count=False,
+    only_initial=False, only_utf8=False, only_text_plain=False
+):
+    """
+    Select the filenames whose metadata match the given filters, in the given order
+    """
+
+    selection = []
+
+    for filename in filenames:
+        if len(selection) == limit:
+            break
+
+        record = manifest[filename]
+
+        if not any(record[1:FIRST_INTEGER_FIELD]):
+            continue # no metadata header
+
+        if max_line_count and record.line_count > max_line_count:
+            continue # probable log or bash dump
+
+        if (
+            (record.is_initial != "true" and only_initial)
+            or (record.encoding != "UTF-8" and only_utf8)
+            or (record.mime != "text/plain" and only_text_plain)
+        ):
+            continue # this file is not in scope
+
+        selection.append(filename)
+
+    return selection
@@ -0,0 +1,176 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+:Name:
+    ngram_matcher.py
+
+:Authors:
+    Soufian Salim (soufi@nsal.im)
+"""
+
+import codecs
+import os
+import time
+
+from collections import deque
+from optparse import OptionParser
+from utility import timed_print
+
+
+# default paths
+
+DATA_FOLDER = "../data/email.message.tagged/" # folder where heuristically labelled emails are stored
+NGRAMS_FILE = "../var/ngrams" # file containing relevant ngrams
+
+
+class NgramMatcher(object):
+    """
+    Aho-Corasick automaton finding which of a list of ngrams occur in a line, in a single scan of the line
+    An ngram is matched wherever it occurs as a substring (same semantics as line.count(ngram) > 0)
+    """
+
+    def __init__(self, ngrams):
+        self.ngrams = ngrams
+
+        self.transitions = [{}] # state => {char: state}
+        self.outputs = [[]] # state => indexes of the ngrams ending in that state
+
+        # the empty string occurs in every line
+        self.always_matched = set(i for i, ngram in enumerate(ngrams) if len(ngram) == 0)
+
+        # building the trie
+        for i, ngram in enumerate(ngrams):
+            state = 0
+
+            for char in ngram:
+                if char not in self.transitions[state]:
+                    self.transitions.append({})
+                    self.outputs.append([])
+                    self.transitions[state][char] = len(self.transitions) - 1
+
+                state = self.transitions[state][char]
+
+            if len(ngram) > 0:
+                self.outputs[state].append(i)
+
+        # building failure links, breadth first
+        self.failures = [0] * len(self.transitions)
+
+        queue = deque(self.transitions[0].values())
+
+        while queue:
+            state = queue.popleft()
+
+            for char, next_state in self.transitions[state].iteritems():
+                queue.append(next_state)
+
+                failure = self.failures[state]
+
+                while failure and char not in self.transitions[failure]:
+                    failure = self.failures[failure]
+
+                self.failures[next_state] = self.transitions[failure].get(char, 0)
+
+                # ngrams ending in the failure state also end in this state
+                self.outputs[next_state] = self.outputs[next_state] + self.outputs[self.failures[next_state]]
+
+    def match(self, line):
+        """
+        Returns the set of indexes of the ngrams occurring in the line
+        """
+
+        transitions = self.transitions
+        failures = self.failures
+        outputs = self.outputs
+
+        matched = set(self.always_matched)
+
+        state = 0
+
+        for char in line:
+            while state and char not in transitions[state]:
+                state = failures[state]
+
+            state = transitions[state].get(char, 0)
+
+            if outputs[state]:
+                matched.update(outputs[state])
+
+        return matched
+
+
+def benchmark(ngrams, lines):
+    """
+    Compare the matcher with one substring count per ngram, returns both durations in seconds
+    """
+
+    start = time.time()
+
+    expected = [set(i for i, ngram in enumerate(ngrams) if line.count(ngram) > 0) for line in lines]
+
+    substring_duration = time.time() - start
+
+    start = time.time()
+
+    matcher = NgramMatcher(ngrams)
+    results = [matcher.match(line) for line in lines]
+
+    matcher_duration = time.time() - start
+
+    if results != expected:
+        raise AssertionError("the automaton's matches differ from substring matches")
+
+    return substring_duration, matcher_duration
+
+
+def parse_args():
+    """
+    Parse command line options and arguments
+    """
+
+    op = OptionParser(usage="usage: %prog [options]")
+
+    op.add_option("-l", "--limit",
+        dest="limit",
+        default=1000,
+        type="int",
+        help="limits the number of source files used (defaults to 1000)")
+
+    op.add_option("--data_folder",
+        dest="data_folder",
+        default=DATA_FOLDER,
+        type="string",
+        help="path to the data folder")
+
+    op.add_option("--ngrams_file",
+        dest="ngrams_file",
+        default=NGRAMS_FILE,
+        type="string",
+        help="path to the ngrams file")
+
+    return op.parse_args()
+
+
+if __name__ == "__main__":
+    options, arguments = parse_args()
+
+    if not options.data_folder.endswith("/"):
+        options.data_folder += "/"
+
+    ngrams = [ngram.strip() for ngram in codecs.open(options.ngrams_file, "r").readlines()]
+
+    lines = [
+        line.strip()
+            for filename in sorted(os.listdir(options.data_folder))[:options.limit]
+                for line in codecs.open(options.data_folder + filename, "r").readlines()
+                    if not line.startswith("#")
+    ]
+
+    timed_print("matching {0} ngrams in {1} lines...".format(len(ngrams), len(lines)))
+
+    substring_duration, matcher_duration = benchmark(ngrams, lines)
+
+    print("# substring counts: {0:.3f}s".format(substring_duration))
+    print("# automaton:        {0:.3f}s (includes building)".format(matcher_duration))
+    print("# speedup:          x{0:.1f}".format(substring_duration / matcher_duration))
@@ -0,0 +1,118 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+:Name:
+    parse_cache.py
+
+:Authors:
+    Soufian Salim (soufi@nsal.im)
+"""
+
+import hashlib
+import mmap
+import os
+import struct
+
+
+# file layout (little-endian):
+#   header:  magic, format version, number of lines, total number of lines
+#   records: one per line (line number, label, text tiling label, offset and length of the line in the blob)
+#   blob:    the stripped lines, concatenated
+HEADER = struct.Struct("<4sBII")
+RECORD = struct.Struct("<IccII")
+
+MAGIC = b"EAPC"
+VERSION = 1
+
+
+def parsed_file_key(data, tt_labels):
+    """
+    Content hash of a tagged email file and the text tiling labels of its lines
+    """
+
+    digest = hashlib.sha1()
+
+    digest.update(str(len(data)).encode("ascii") + b"\0") # separates both contents
+    digest.update(data)
+    digest.update(" ".join(str(label) for label in tt_labels))
+
+    return digest.hexdigest()
+
+
+def is_cacheable(line_data):
+    """
+    Only single character labels can be stored in the binary format
+    """
+
+    return all(len(label) == 1 and len(tt_label) == 1 for line, tokens, label, tt_label, line_number, total_lines in line_data)
+
+
+def write_parsed_file(path, line_data, total_lines):
+    """
+    Write a parsed file in the binary cache format
+    """
+
+    records = []
+    blob = []
+    offset = 0
+
+    for line, tokens, label, tt_label, line_number, line_total in line_data:
+        records.append(RECORD.pack(line_number, label, tt_label, offset, len(line)))
+        blob.append(line)
+        offset += len(line)
+
+    folder = os.path.dirname(path)
+
+    if folder and not os.path.exists(folder):
+        os.makedirs(folder)
+
+    temporary_path = "{0}.{1}.tmp".format(path, os.getpid())
+
+    with open(temporary_path, "wb") as out:
+        out.write(HEADER.pack(MAGIC, VERSION, len(records), total_lines))
+        out.write(b"".join(records))
+        out.write(b"".join(blob))
+
+    os.rename(temporary_path, path) # atomic, a partially written entry is never read
+
+
+def read_parsed_file(path):
+    """
+    Read a parsed file from the binary cache format, returns None if the entry is invalid
+    """
+
+    with open(path, "rb") as cache_file:
+        if os.fstat(cache_file.fileno()).st_size < HEADER.size:
+            return None
+
+        contents = mmap.mmap(cache_file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        try:
+            magic, version, line_count, total_lines = HEADER.unpack_from(contents, 0)
+
+            if magic != MAGIC or version != VERSION:
+                return None
+
+            blob_start = HEADER.size + line_count * RECORD.size
+
+            line_data = []
+
+            for i in range(line_count):
+                line_number, label, tt_label, offset, length = RECORD.unpack_from(contents, HEADER.size + i * RECORD.size)
+
+                line = contents[blob_start + offset:blob_start + offset + length]
+
+                line_data.append((line, line.split()[1:], label, tt_label, line_number, total_lines))
+
+            return line_data
+        finally:
+            contents.close()
+
+
+def cache_path(cache_folder, key):
+    """
+    Path of a cache entry
+    """
+
+    return "{0}{1}/{2}".format(cache_folder, key[:2], key)
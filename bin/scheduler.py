@@ -0,0 +1,86 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+:Name:
+    scheduler.py
+
+:Authors:
+    Soufian Salim (soufi@nsal.im)
+"""
+
+import sys
+import threading
+
+
+class FoldScheduler(object):
+    """
+    Runs the training, labelling and evaluation of up to n folds concurrently, while the next folds' data is being built
+    The cpu budget is split between concurrent folds, each of them running wapiti with its share of threads
+    """
+
+    def __init__(self, jobs, cpus):
+        self.jobs = jobs
+        self.wapiti_threads = max(1, cpus // jobs) # threads of each fold's wapiti processes
+
+        self.slots = threading.BoundedSemaphore(jobs)
+        self.workers = []
+
+        self.results = {} # fold => result of its job
+        self.errors = {} # fold => exception info of its job
+
+    def reserve(self):
+        """
+        Blocks until a fold can start its wapiti processes (the slot is released when the job submitted for it ends)
+        """
+
+        self.slots.acquire()
+
+    def submit(self, fold, function, *args):
+        """
+        Runs a fold's job in a slot reserved beforehand, in the calling thread if folds do not run concurrently
+        """
+
+        if self.jobs == 1:
+            try:
+                self.results[fold] = function(*args)
+            finally:
+                self.slots.release()
+
+            return
+
+        worker = threading.Thread(target=self.run, args=(fold, function, args))
+        worker.daemon = True # an interrupted run does not wait for its folds
+        worker.start()
+
+        self.workers.append(worker)
+
+    def run(self, fold, function, args):
+        """
+        Runs a fold's job in a worker thread
+        """
+
+        try:
+            self.results[fold] = function(*args)
+        except Exception:
+            self.errors[fold] = sys.exc_info()
+        finally:
+            self.slots.release()
+
+    def wait(self):
+        """
+        Waits for all folds to end, returns (fold, result) pairs in fold order (the error of the first failed fold is raised again)
+        """
+
+        for worker in self.workers:
+            while worker.is_alive():
+                worker.join(1) # a join without timeout cannot be interrupted
+
+        self.workers = []
+
+        if len(self.errors) > 0:
+            error_type, error, traceback = self.errors[min(self.errors)]
+
+            raise error_type, error, traceback
+
+        return sorted(self.results.iteritems())
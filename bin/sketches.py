@@ -0,0 +1,180 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+:Name:
+    sketches.py
+
+:Authors:
+    Soufian Salim (soufi@nsal.im)
+"""
+
+import numpy as np
+import random
+
+from vectorized import accumulate_sums
+
+
+QUARTILES = [0.25, 0.5, 0.75]
+
+
+class RunningMean(object):
+    """
+    Means of the columns of a stream of (lines, features) matrices
+    Sums are kept rather than means, so that results are identical to those of a full pass and merging sketches is exact
+    """
+
+    def __init__(self, size):
+        self.sums = np.zeros(size)
+        self.count = 0
+
+    def update(self, values):
+        """
+        Add the rows of a (lines, features) matrix
+        """
+
+        self.sums = accumulate_sums(self.sums, values)
+        self.count += len(values)
+
+    def merge(self, other):
+        """
+        Add the rows seen by another running mean
+        """
+
+        self.sums = self.sums + other.sums
+        self.count += other.count
+
+    def means(self):
+        """
+        Means of the columns of the rows seen so far
+        """
+
+        return self.sums / self.count
+
+
+class QuantileSketch(object):
+    """
+    Approximate quantiles of a stream of values, in bounded memory
+    Values are stored in levels whose items weigh 2^level: when a level holds more than k values, they are sorted
+    and every other one (starting at a random offset) is promoted to the next level, the rank error being about 1/k
+    """
+
+    def __init__(self, k=256, seed=0):
+        self.k = k
+        self.levels = [np.empty(0)]
+        self.count = 0
+        self.random = random.Random(seed) # compactions are reproducible
+
+    def update(self, values):
+        """
+        Add values to the sketch
+        """
+
+        self.levels[0] = np.concatenate([self.levels[0], np.asarray(values, dtype=np.float64)])
+        self.count += len(values)
+
+        self.compress()
+
+    def merge(self, other):
+        """
+        Add the values seen by another sketch
+        """
+
+        while len(self.levels) < len(other.levels):
+            self.levels.append(np.empty(0))
+
+        for level, values in enumerate(other.levels):
+            self.levels[level] = np.concatenate([self.levels[level], values])
+
+        self.count += other.count
+
+        self.compress()
+
+    def compress(self):
+        """
+        Halve the levels holding more than k values
+        """
+
+        level = 0
+
+        while level < len(self.levels):
+            values = self.levels[level]
+
+            if len(values) > self.k:
+                values = np.sort(values)
+
+                # an odd value out stays at its level
+                kept, values = values[len(values) - len(values) % 2:], values[:len(values) - len(values) % 2]
+
+                if level + 1 == len(self.levels):
+                    self.levels.append(np.empty(0))
+
+                self.levels[level] = kept
+                self.levels[level + 1] = np.concatenate([self.levels[level + 1], values[self.random.randint(0, 1)::2]])
+
+            level += 1
+
+    def quantiles(self, ranks):
+        """
+        Values at the given ranks (between 0 and 1)
+        """
+
+        values = np.concatenate(self.levels)
+
+        if len(values) == 0:
+            return [0.0] * len(ranks)
+
+        weights = np.concatenate([np.repeat(2.0 ** level, len(level_values)) for level, level_values in enumerate(self.levels)])
+
+        order = np.argsort(values, kind="mergesort")
+        cumulated_weights = np.cumsum(weights[order])
+
+        positions = np.searchsorted(cumulated_weights, np.array(ranks) * cumulated_weights[-1])
+
+        return values[order][np.minimum(positions, len(values) - 1)].tolist()
+
+
+class StreamingStatistics(object):
+    """
+    Means and quantile sketches of the columns of a stream of (lines, features) matrices
+    """
+
+    def __init__(self, names, k=256):
+        self.names = names
+
+        self.mean = RunningMean(len(names))
+        self.sketches = [QuantileSketch(k=k, seed=i) for i in xrange(len(names))]
+
+    def update(self, values):
+        """
+        Add the rows of a (lines, features) matrix
+        """
+
+        self.mean.update(values)
+
+        for column, sketch in enumerate(self.sketches):
+            sketch.update(values[:, column])
+
+    def merge(self, other):
+        """
+        Add the rows seen by other statistics
+        """
+
+        self.mean.merge(other.mean)
+
+        for sketch, other_sketch in zip(self.sketches, other.sketches):
+            sketch.merge(other_sketch)
+
+    def averages(self):
+        """
+        Feature name => average value
+        """
+
+        return dict(zip(self.names, self.mean.means().tolist()))
+
+    def quartiles(self):
+        """
+        Feature name => first, second and third quartiles
+        """
+
+        return {name: sketch.quantiles(QUARTILES) for name, sketch in zip(self.names, self.sketches)}
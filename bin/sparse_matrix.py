@@ -0,0 +1,154 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+:Name:
+    sparse_matrix.py
+
+:Authors:
+    Soufian Salim (soufi@nsal.im)
+"""
+
+import codecs
+import numpy as np
+import os
+
+from array import array
+
+
+FORMATS = ["npz", "svmlight"]
+
+
+def encode_feature(value, name, attribute_type):
+    """
+    Column name and value of a feature: numeric features keep their value, booleans are 0 or 1
+    and other features (strings, nominal values) are one-hot encoded
+    """
+
+    if attribute_type in ["integer", "real"]:
+        return name, float(value)
+    elif attribute_type == "{TRUE, FALSE}":
+        return name, 1.0 if value else 0.0
+
+    return "{0}={1}".format(name, value), 1.0
+
+
+class SparseMatrixBuilder(object):
+    """
+    Accumulates featurized messages into a CSR matrix, along with the label of each line and the boundaries of each message
+    """
+
+    def __init__(self, labels):
+        self.labels = labels
+
+        self.columns = {} # column name => column index
+        self.column_names = []
+
+        # CSR arrays
+        self.indptr = array("l", [0])
+        self.indices = array("l")
+        self.data = array("d")
+
+        self.targets = array("l") # label index of each row
+        self.sequences = array("l", [0]) # first row of each message (and number of rows)
+
+    def add_dataset(self, dataset):
+        """
+        Add the lines of a message
+        """
+
+        for label, line, features in dataset:
+            row = {}
+
+            for value, name, attribute_type in features:
+                column_name, x = encode_feature(value, name, attribute_type)
+
+                if x == 0:
+                    continue
+
+                column = self.columns.get(column_name)
+
+                if column is None:
+                    column = self.columns[column_name] = len(self.column_names)
+                    self.column_names.append(column_name)
+
+                row[column] = x
+
+            for column in sorted(row):
+                self.indices.append(column)
+                self.data.append(row[column])
+
+            self.indptr.append(len(self.indices))
+            self.targets.append(self.labels.index(label))
+
+        if len(dataset) > 0:
+            self.sequences.append(len(self.targets))
+
+    def matrix(self):
+        """
+        Returns the CSR matrix of the added lines
+        """
+
+        from scipy.sparse import csr_matrix # only needed by --matrix builds
+
+        return csr_matrix(
+            (np.frombuffer(self.data, dtype=np.float64), np.array(self.indices), np.array(self.indptr)),
+            shape=(len(self.targets), len(self.column_names))
+        )
+
+    def save(self, path, matrix_format="npz"):
+        """
+        Write the matrix, labels and message boundaries (as a .npz file or as a svmlight file where messages are queries)
+        and the column names (one per line, in a .features file)
+        """
+
+        folder = os.path.dirname(path)
+
+        if folder and not os.path.exists(folder):
+            os.makedirs(folder)
+
+        if matrix_format == "npz":
+            np.savez_compressed(
+                path,
+                data=np.frombuffer(self.data, dtype=np.float64), indices=np.array(self.indices), indptr=np.array(self.indptr),
+                shape=np.array([len(self.targets), len(self.column_names)]),
+                labels=np.array(self.targets), label_names=np.array(self.labels),
+                sequences=np.array(self.sequences)
+            )
+        else:
+            with codecs.open(path, "w") as out:
+                for sequence in xrange(len(self.sequences) - 1):
+                    for row in xrange(self.sequences[sequence], self.sequences[sequence + 1]):
+                        out.write("{0} qid:{1}{2}\n".format(
+                            self.targets[row], sequence + 1, "".join(
+                                # svmlight indexes are one-based
+                                " {0}:{1!r}".format(self.indices[i] + 1, self.data[i])
+                                    for i in xrange(self.indptr[row], self.indptr[row + 1])
+                            )
+                        ))
+
+        with codecs.open(feature_names_path(path), "w") as out:
+            for column_name in self.column_names:
+                out.write("{0}\n".format(column_name))
+
+
+def feature_names_path(path):
+    """
+    Path of the column names file of a matrix
+    """
+
+    return os.path.splitext(path)[0] + ".features"
+
+
+def load_matrix(path):
+    """
+    Read a .npz file written by SparseMatrixBuilder.save, returns the CSR matrix, the labels and the message boundaries
+    """
+
+    from scipy.sparse import csr_matrix # only needed by --matrix builds
+
+    contents = np.load(path)
+
+    matrix = csr_matrix((contents["data"], contents["indices"], contents["indptr"]), shape=tuple(contents["shape"]))
+
+    return matrix, contents["label_names"][contents["labels"]], contents["sequences"]
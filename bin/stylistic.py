@@ -0,0 +1,169 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+:Name:
+    stylistic.py
+
+:Authors:
+    Soufian Salim (soufi@nsal.im)
+"""
+
+from collections import namedtuple
+from ngram_matcher import NgramMatcher
+
+
+# raw measures of a line, from which both scripts derive their stylistic (visual) features
+LineAnalysis = namedtuple("LineAnalysis", [
+    "number_of_tokens",
+    "number_of_chars",
+    "number_of_quote_symbols",
+    "token_length_sum",
+    "number_of_uppercase_chars",
+    "number_of_alphabetic_chars",
+    "number_of_numeric_chars",
+    "has_question_mark",
+    "ends_with_question_mark",
+    "has_colon",
+    "ends_with_colon",
+    "has_semicolon",
+    "ends_with_semicolon",
+    "has_early_punctuation",
+    "has_interrogating_word",
+    "starts_with_interrogating_form",
+    "personal_pronoun", # the last personal pronoun of the line, uppercased (None if there is none)
+    "contains_modal_word",
+    "contains_plan_phrase",
+    "contains_first_person_mark",
+    "contains_second_person_mark",
+    "contains_third_person_mark"
+])
+
+PUNCTUATION = set([".", ";", ":", "?", "!", ","])
+
+INTERROGATING_WORDS = set(["who", "when", "where", "what", "which", "what", "how"])
+
+INTERROGATING_FORMS = INTERROGATING_WORDS | set(["is", "are", "am", "will", "do", "does", "have", "has"])
+
+PERSONAL_PRONOUNS = set(["i", "you", "he", "she", "we", "they"])
+
+# lexicons are searched as substrings of the lowercased line
+LEXICONS = [
+    ("contains_modal_word", [
+        "may", "must", "musn" "shall", "shan" "will", "might", "should", "would", "could"
+    ]),
+    ("contains_plan_phrase", [
+        "i will", "i am going to", "we will", "we are going to", "i plan to", "we plan to"
+    ]),
+    ("contains_first_person_mark", [
+        "me", "us", "i", "we", "my", "mine", "myself", "ourselves"
+    ]),
+    ("contains_second_person_mark", [
+        "you", "your", "yours", "yourself", "yourselves"
+    ]),
+    ("contains_third_person_mark", [
+        "he", "she", "they", "his", "their", "hers", "him", "her", "them"
+    ])
+]
+
+# a single automaton matches the entries of all lexicons
+LEXICON_MATCHER = NgramMatcher([entry for name, entries in LEXICONS for entry in entries])
+
+# index of the lexicon of each entry of the automaton
+LEXICON_INDEXES = [i for i, (name, entries) in enumerate(LEXICONS) for entry in entries]
+
+# character classes, as bit flags
+UPPERCASE, ALPHABETIC, NUMERIC, QUOTE_SYMBOL, QUESTION_MARK, COLON, SEMICOLON = [1 << i for i in range(7)]
+
+SYMBOL_FLAGS = {">": QUOTE_SYMBOL, "?": QUESTION_MARK, ":": COLON, ";": SEMICOLON}
+
+# character => flags, filled as characters are met
+character_flags = {}
+
+
+def classify_character(char):
+    """
+    Compute the flags of a character
+    """
+
+    flags = SYMBOL_FLAGS.get(char, 0)
+
+    if char.isupper():
+        flags |= UPPERCASE
+    if char.isalpha():
+        flags |= ALPHABETIC
+    if char.isdigit():
+        flags |= NUMERIC
+
+    character_flags[char] = flags
+
+    return flags
+
+
+def analyze_line(line, tokens):
+    """
+    Compute all raw stylistic measures of a line in a single scan of its characters and tokens
+    """
+
+    uppercase = alphabetic = numeric = quote_symbols = 0
+    symbols = 0 # union of the flags of the line's symbols
+
+    for char in line:
+        flags = character_flags.get(char)
+
+        if flags is None:
+            flags = classify_character(char)
+
+        if flags:
+            if flags & UPPERCASE:
+                uppercase += 1
+            if flags & ALPHABETIC:
+                alphabetic += 1
+            if flags & NUMERIC:
+                numeric += 1
+            if flags & QUOTE_SYMBOL:
+                quote_symbols += 1
+
+            symbols |= flags
+
+    token_length_sum = 0
+    last_punctuation_position = 999
+    has_interrogating_word = False
+    personal_pronoun = None
+
+    for i, token in enumerate(tokens):
+        token_lower = token.lower()
+
+        token_length_sum += len(token)
+
+        if token in PUNCTUATION:
+            last_punctuation_position = i
+
+        if token_lower in INTERROGATING_WORDS:
+            has_interrogating_word = True
+
+        if token_lower in PERSONAL_PRONOUNS:
+            personal_pronoun = token.upper()
+
+    lexicons = set(LEXICON_INDEXES[i] for i in LEXICON_MATCHER.match(line.lower()))
+
+    return LineAnalysis(
+        len(tokens),
+        len(line),
+        quote_symbols,
+        token_length_sum,
+        uppercase,
+        alphabetic,
+        numeric,
+        bool(symbols & QUESTION_MARK),
+        line.endswith("?"),
+        bool(symbols & COLON),
+        line.endswith(":"),
+        bool(symbols & SEMICOLON),
+        line.endswith(";"),
+        last_punctuation_position < 4,
+        has_interrogating_word,
+        len(tokens) > 0 and tokens[0].lower() in INTERROGATING_FORMS,
+        personal_pronoun,
+        *[i in lexicons for i in range(len(LEXICONS))]
+    )
@@ -0,0 +1,117 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+:Name:
+    symbols.py
+
+:Authors:
+    Soufian Salim (soufi@nsal.im)
+"""
+
+import codecs
+import os
+import string
+
+
+SYMBOL_CHARS = string.digits + string.ascii_lowercase + string.ascii_uppercase
+
+
+def make_symbol(n):
+    """
+    Short symbol of a non-negative integer (base 62)
+    """
+
+    symbol = SYMBOL_CHARS[n % len(SYMBOL_CHARS)]
+
+    while n >= len(SYMBOL_CHARS):
+        n /= len(SYMBOL_CHARS)
+        symbol = SYMBOL_CHARS[n % len(SYMBOL_CHARS)] + symbol
+
+    return symbol
+
+
+class SymbolTable(object):
+    """
+    Interns the values of each column of a datafile into short symbols, in order of first appearance
+    Symbols are only unique within a column: wapiti patterns never compare values of different columns
+    If a path is given, the symbols of a previously saved table are kept
+    """
+
+    def __init__(self, verbatim_columns=(), path=None):
+        self.symbols = [] # column => {value: symbol}
+        self.values = [] # column => values, in order of first appearance (i.e. of their symbols)
+        self.verbatim_columns = set(verbatim_columns) # columns whose values are written as they are
+
+        if path and os.path.exists(path):
+            with codecs.open(path, "r") as table_file:
+                for line in table_file:
+                    column, symbol, value = line.rstrip("\n").split("\t")
+
+                    while len(self.symbols) <= int(column):
+                        self.symbols.append({})
+                        self.values.append([])
+
+                    self.symbols[int(column)][value] = symbol
+                    self.values[int(column)].append(value)
+
+    def encode(self, values):
+        """
+        Returns the symbols of a row's values
+        """
+
+        while len(self.symbols) < len(values):
+            self.symbols.append({})
+            self.values.append([])
+
+        encoded = []
+
+        for column, value in enumerate(values):
+            if column in self.verbatim_columns:
+                encoded.append(value)
+                continue
+
+            column_symbols = self.symbols[column]
+            symbol = column_symbols.get(value)
+
+            if symbol is None:
+                symbol = column_symbols[value] = make_symbol(len(column_symbols))
+                self.values[column].append(value)
+
+            encoded.append(symbol)
+
+        return encoded
+
+    def save(self, path):
+        """
+        Write the table as tab-separated column, symbol and value lines
+        """
+
+        folder = os.path.dirname(path)
+
+        if folder and not os.path.exists(folder):
+            os.makedirs(folder)
+
+        with codecs.open(path, "w") as out:
+            for column, column_values in enumerate(self.values):
+                for n, value in enumerate(column_values):
+                    out.write("{0}\t{1}\t{2}\n".format(column, make_symbol(n), value))
+
+
+def load_symbol_table(path):
+    """
+    Read a table written by SymbolTable.save, returns column => {symbol: value}
+    """
+
+    symbols = []
+
+    with codecs.open(path, "r") as table_file:
+        for line in table_file:
+            column, symbol, value = line.rstrip("\n").split("\t")
+
+            while len(symbols) <= int(column):
+                symbols.append({})
+
+            symbols[int(column)][symbol] = value
+
+    return symbols
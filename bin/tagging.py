@@ -0,0 +1,108 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+:Name:
+    tagging.py
+
+:Authors:
+    Soufian Salim (soufi@nsal.im)
+"""
+
+import cPickle
+import os
+
+try:
+    from nltk import pos_tag_sents
+except ImportError: # nltk 2.x
+    from nltk import batch_pos_tag as pos_tag_sents
+
+
+class TagCache(object):
+    """
+    Part-of-speech tags of token sequences, tagged in batches and memoized (optionally on disk)
+    """
+
+    def __init__(self, path=None):
+        self.path = path
+        self.tags = {} # (token, ...) => (tag, ...)
+        self.added = {} # entries tagged since the last call to pop_added
+        self.modified = False
+
+        if path and os.path.exists(path):
+            with open(path, "rb") as cache_file:
+                self.tags = cPickle.load(cache_file)
+
+    def prefetch(self, sentences):
+        """
+        Tag all the sentences that are not cached yet in a single batch
+        """
+
+        misses = list(set(key for key in (tuple(tokens) for tokens in sentences) if key not in self.tags))
+
+        if len(misses) == 0:
+            return
+
+        for tokens, tagged_tokens in zip(misses, pos_tag_sents([list(tokens) for tokens in misses])):
+            tags = tuple(tag for token, tag in tagged_tokens)
+
+            self.tags[tokens] = tags
+            self.added[tokens] = tags
+
+        self.modified = True
+
+    def tag(self, tokens):
+        """
+        Returns (token, tag) pairs in the format of nltk.pos_tag
+        """
+
+        key = tuple(tokens)
+
+        if key not in self.tags:
+            self.prefetch([key])
+
+        return zip(tokens, self.tags[key])
+
+    def update(self, entries):
+        """
+        Add entries tagged elsewhere (by another process for instance)
+        """
+
+        self.tags.update(entries)
+        self.added.update(entries)
+
+        self.modified = self.modified or len(entries) > 0
+
+    def pop_added(self):
+        """
+        Returns and forgets the entries tagged since the last call
+        """
+
+        added = self.added
+        self.added = {}
+
+        return added
+
+    def save(self, path=None):
+        """
+        Write the cache to disk, if new entries were tagged since it was loaded
+        """
+
+        path = path or self.path
+
+        if not path or not self.modified:
+            return
+
+        folder = os.path.dirname(path)
+
+        if folder and not os.path.exists(folder):
+            os.makedirs(folder)
+
+        temporary_path = "{0}.{1}.tmp".format(path, os.getpid())
+
+        with open(temporary_path, "wb") as out:
+            cPickle.dump(self.tags, out, cPickle.HIGHEST_PROTOCOL)
+
+        os.rename(temporary_path, path)
+
+        self.modified = False
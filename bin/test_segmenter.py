@@ -16,7 +16,8 @@ import linecache
 import os
 import subprocess
 
-from dataset_builder import WAPITI_TRAIN_FILE, WAPITI_TEST_FILE, WAPITI_GOLD_FILE, WAPITI_ORIGIN_FILE
+from dataset_builder import WAPITI_TRAIN_FILE, WAPITI_TEST_FILE, WAPITI_GOLD_FILE, WAPITI_ORIGIN_FILE, WAPITI_SCHEMA_FILE
+from feature_schema import GROUPS, load_schema, write_patterns
 from math import ceil
 from nltk.metrics.scores import accuracy
 from nltk.metrics.segmentation import windowdiff, ghd, pk
@@ -54,6 +55,7 @@ def test_segment(opts, args):
 
     # make_patterns(
     #     pattern_file,
+    #     load_schema(opts.wapiti_schema),
     #     opts.window,
     #     syntactic=opts.syntactic, stylistic=opts.stylistic, lexical=opts.lexical, thematic=opts.thematic
     # )
@@ -100,64 +102,21 @@ def test_segment(opts, args):
 
 def make_patterns(
     path, 
+    schema,
     window=5, 
-    syntactic=False, stylistic=False, lexical=False, thematic=False, 
-    nb_stylistic=24, nb_lexical=1000, nb_thematic=1
+    syntactic=False, stylistic=False, lexical=False, thematic=False
 ):
     """
-    Export a pattern file
+    Export a pattern file for the columns of the given feature groups present in the datafiles' schema
     """
 
-    with codecs.open(path, "w") as out:
-        i = 1
-
-        window_left = int(ceil(window - (window * 1.5)))
-        window_right = window_left + window
-
-        for offset in xrange(window_left, window_right):
-
-            x = str(offset) if offset < 1 else "+" + str(offset)
-
-            if syntactic:
-                for group_offset in [0, 9]:
-                    for type_offset in xrange(0, 3):
-                        y = type_offset + group_offset
-
-                        # n-grams
-
-                        out.write("*{0}:%x[{1},{2}]\n".format(i, x, y + 0)) # uni 1
-                        i += 1
-                        out.write("*{0}:%x[{1},{2}]\n".format(i, x, y + 3)) # uni 2
-                        i += 1
-                        out.write("*{0}:%x[{1},{2}]\n".format(i, x, y + 6)) # uni 3
-                        i += 1
-                        out.write("*{0}:%x[{1},{2}]/%x[{1},{3}]\n".format(i, x, y + 0, y + 3)) # bi 1
-                        i += 1
-                        out.write("*{0}:%x[{1},{2}]/%x[{1},{3}]\n".format(i, x, y + 3, y + 6)) # bi 2
-                        i += 1
-                        out.write("*{0}:%x[{1},{2}]/%x[{1},{3}]/%x[{1},{4}]\n".format(i, x, y + 0, y + 3, y + 6)) # tri
-                        i += 1
+    window_left = int(ceil(window - (window * 1.5)))
+    window_right = window_left + window
 
-                    out.write("\n")
+    groups = [group for group, enabled in zip(GROUPS, [syntactic, stylistic, lexical, thematic]) if enabled]
 
-            start_stylistic = 18
-            start_lexical = start_stylistic + (nb_stylistic if stylistic else 0)
-            start_thematic = start_lexical + (nb_lexical if lexical else 0)
-            end = start_thematic + (nb_thematic if thematic else 0)
-
-            for y in xrange(start_stylistic, start_lexical):
-                out.write("*{0}:%x[{1},{2}]\n".format(i, x, y))
-                i += 1
-
-            for y in xrange(start_lexical, start_thematic):
-                out.write("*{0}:%x[{1},{2}]\n".format(i, x, y))
-                i += 1
-
-            for y in xrange(start_thematic, end):
-                out.write("*{0}:%x[{1},{2}]\n".format(i, x, y))
-                i += 1
-
-            out.write("\n")
+    with codecs.open(path, "w") as out:
+        write_patterns(out, schema, xrange(window_left, window_right), groups)
 
 
 def write_k_folds(source_train, source_test, source_gold, source_origin, target_folder, folds=10):
@@ -449,6 +408,12 @@ def parse_args():
         type="string",
         help="input origin file")
 
+    op.add_option("--wapiti_schema",
+        dest="wapiti_schema",
+        default=WAPITI_SCHEMA_FILE,
+        type="string",
+        help="input datafiles' schema")
+
     ########################################
 
     op.add_option("-f", "--folds",
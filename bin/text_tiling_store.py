@@ -0,0 +1,199 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+:Name:
+    text_tiling_store.py
+
+:Authors:
+    Soufian Salim (soufi@nsal.im)
+"""
+
+import codecs
+import mmap
+import numpy as np
+import os
+import struct
+
+
+# file layout (little-endian):
+#   header:  magic, format version, number of messages, size of the filenames blob
+#   entries: one per message (length of its filename, number of lines, offset of its labels in the bits blob,
+#            size and mtime of its text tiling file when it was read)
+#   blobs:   the filenames, concatenated, then the labels of each message packed as bits (1 for "S"), each starting on a byte
+HEADER = struct.Struct("<4sBII")
+ENTRY = struct.Struct("<IIIQd")
+
+MAGIC = b"EATT"
+VERSION = 2
+
+LABELS = ["O", "S"] # text tiling labels, by bit value
+
+
+class TextTilingStore(object):
+    """
+    Text tiling labels of the corpus' messages, one bit per line, read from a memory-mapped file
+    Messages that are not in the store yet, or whose text tiling file changed since it was stored (size or mtime, as in the manifest),
+    are read from the text tiling folder and added to the store when it is saved
+    """
+
+    def __init__(self, folder, path=None):
+        self.folder = folder
+        self.path = path
+
+        self.entries = {} # filename => (number of lines, offset of the labels in the bits blob, size, mtime)
+        self.checked = set() # stored messages whose text tiling file was found unchanged
+        self.bits = b"" # memory-mapped store file
+        self.bits_start = 0 # position of the bits blob in the store file
+
+        self.added = {} # filename => labels of the messages read since the store was loaded
+        self.added_stats = {} # filename => (size, mtime) of the text tiling files of added messages
+        self.irregular = {} # filename => labels of the messages whose labels cannot be stored as bits (never saved)
+
+        if path and os.path.exists(path):
+            self.load(path)
+
+    def load(self, path):
+        """
+        Map the store's file into memory and read its entries
+        """
+
+        with open(path, "rb") as store_file:
+            if os.fstat(store_file.fileno()).st_size < HEADER.size:
+                return
+
+            contents = mmap.mmap(store_file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, version, message_count, names_size = HEADER.unpack_from(contents, 0)
+
+        if magic != MAGIC or version != VERSION:
+            return
+
+        names_start = HEADER.size + message_count * ENTRY.size
+        name_offset = names_start
+
+        for i in xrange(message_count):
+            name_length, line_count, offset, size, mtime = ENTRY.unpack_from(contents, HEADER.size + i * ENTRY.size)
+
+            self.entries[contents[name_offset:name_offset + name_length]] = (line_count, offset, size, mtime)
+
+            name_offset += name_length
+
+        self.bits = contents
+        self.bits_start = names_start + names_size
+
+    def labels(self, filename):
+        """
+        Text tiling labels of the lines of a message
+        """
+
+        if self.is_current(filename):
+            line_count, offset, size, mtime = self.entries[filename]
+
+            start = self.bits_start + offset
+            packed = np.frombuffer(self.bits[start:start + (line_count + 7) // 8], dtype=np.uint8)
+
+            return [LABELS[bit] for bit in np.unpackbits(packed)[:line_count].tolist()]
+
+        if filename not in self.added and filename not in self.irregular:
+            with codecs.open(self.folder + filename, "r") as tt_file:
+                stat = os.fstat(tt_file.fileno())
+                labels = [line.split()[0] if len(line.split()) > 0 else "O" for line in tt_file] # blank lines are not boundaries
+
+            if all(label in LABELS for label in labels):
+                self.added[filename] = labels
+                self.added_stats[filename] = (stat.st_size, stat.st_mtime)
+            else:
+                self.irregular[filename] = labels
+
+        return self.added[filename] if filename in self.added else self.irregular[filename]
+
+    def label(self, filename, index):
+        """
+        Text tiling label of a line of a message (negative indexes count from the end of the message)
+        """
+
+        if not self.is_current(filename):
+            return self.labels(filename)[index]
+
+        line_count, offset, size, mtime = self.entries[filename]
+
+        if index < 0:
+            index += line_count
+
+        if not 0 <= index < line_count:
+            raise IndexError("{0} has {1} text tiling labels".format(filename, line_count))
+
+        return LABELS[(ord(self.bits[self.bits_start + offset + index // 8]) >> (7 - index % 8)) & 1]
+
+    def is_current(self, filename):
+        """
+        Whether a message's labels are stored and its text tiling file did not change since (checked once per message)
+        Stored labels of changed files are dropped, the file is read again
+        """
+
+        if filename not in self.entries:
+            return False
+
+        if filename not in self.checked:
+            line_count, offset, size, mtime = self.entries[filename]
+
+            try:
+                stat = os.stat(self.folder + filename)
+            except OSError:
+                stat = None # the stored labels are used if the text tiling file is not available anymore
+
+            if stat is not None and (stat.st_size, stat.st_mtime) != (size, mtime):
+                del self.entries[filename]
+
+                return False
+
+            self.checked.add(filename)
+
+        return True
+
+    def save(self, path=None):
+        """
+        Write the store to disk, if messages were added since it was loaded
+        """
+
+        path = path or self.path
+
+        if not path or len(self.added) == 0:
+            return
+
+        for filename in list(self.entries):
+            self.labels(filename) # stored labels of changed files are read again
+
+        messages = [
+            (filename, self.labels(filename), self.entries[filename][2:]) for filename in sorted(self.entries)
+        ] + [
+            (filename, labels, self.added_stats[filename]) for filename, labels in sorted(self.added.items())
+        ]
+
+        entries, names, bits = [], [], []
+        offset = 0
+
+        for filename, labels, (size, mtime) in messages:
+            packed = np.packbits(np.array([LABELS.index(label) for label in labels], dtype=np.uint8)).tostring()
+
+            entries.append(ENTRY.pack(len(filename), len(labels), offset, size, mtime))
+            names.append(filename)
+            bits.append(packed)
+
+            offset += len(packed)
+
+        folder = os.path.dirname(path)
+
+        if folder and not os.path.exists(folder):
+            os.makedirs(folder)
+
+        temporary_path = "{0}.{1}.tmp".format(path, os.getpid())
+
+        with open(temporary_path, "wb") as out:
+            out.write(HEADER.pack(MAGIC, VERSION, len(entries), sum(len(name) for name in names)))
+            out.write(b"".join(entries))
+            out.write(b"".join(names))
+            out.write(b"".join(bits))
+
+        os.rename(temporary_path, path) # atomic, a partially written store is never read
@@ -9,6 +9,8 @@
     Soufian Salim (soufi@nsal.im)
 """
 
+import resource
+import sys
 import time
 
 
@@ -25,12 +27,31 @@ def compute_file_length(path, ignore_empty=False, comment_char="#"):
     Compute the length of a file
     """
 
+    return compute_lines_length(open(path), ignore_empty=ignore_empty, comment_char=comment_char)
+
+
+def compute_lines_length(lines, ignore_empty=False, comment_char="#"):
+    """
+    Compute the length of a file from its lines
+    """
+
     return sum(
-        1 for line in open(path) 
+        1 for line in lines 
         if not line.startswith(comment_char) and (len(line.strip()) > 1 or not ignore_empty)
     )
 
 
+def peak_memory_usage():
+    """
+    Returns the peak resident set size of the current process, in megabytes
+    """
+
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    # kilobytes on Linux, bytes on OS X
+    return peak / (1024.0 * 1024.0) if sys.platform == "darwin" else peak / 1024.0
+
+
 def float_to_string(f):
     """
     Converts float to string
@@ -0,0 +1,119 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+:Name:
+    vectorized.py
+
+:Authors:
+    Soufian Salim (soufi@nsal.im)
+"""
+
+import numpy as np
+
+from stylistic import analyze_line
+
+
+# columns of the numeric stylistic features matrices, in the order used by dataset_builder
+NUMERIC_FEATURE_NAMES = [
+    "position",
+    "number_of_tokens",
+    "number_of_chars",
+    "number_of_quote_symbols",
+    "average_token_length",
+    "proportion_of_uppercase_chars",
+    "proportion_of_alphabetic_chars",
+    "proportion_of_numeric_chars"
+]
+
+# tiers, in the order of their indexes
+TIERS = ["low", "high", "highest", "lowest"]
+
+LOW, HIGH, HIGHEST, LOWEST = range(len(TIERS))
+
+
+def measure_lines(file_data):
+    """
+    Numeric stylistic features of the lines of a parsed file, as a (lines, features) float matrix
+    Values are the same as dataset_builder's make_stylistic_features (average token length included, which is an integer division)
+    """
+
+    analyses = [
+        (line_number, total_lines, analyze_line(line, tokens))
+            for line, tokens, label, tt_label, line_number, total_lines in file_data
+    ]
+
+    counts = np.array([
+        (
+            line_number,
+            total_lines,
+            analysis.number_of_tokens,
+            analysis.number_of_chars,
+            analysis.number_of_quote_symbols,
+            analysis.token_length_sum,
+            analysis.number_of_uppercase_chars,
+            analysis.number_of_alphabetic_chars,
+            analysis.number_of_numeric_chars
+        ) for line_number, total_lines, analysis in analyses
+    ], dtype=np.int64).reshape(-1, 9)
+
+    line_numbers, total_lines, tokens, chars, quote_symbols, token_length_sums = counts[:, :6].T
+
+    values = np.empty((len(counts), len(NUMERIC_FEATURE_NAMES)))
+
+    values[:, 0] = line_numbers.astype(np.float64) / total_lines
+    values[:, 1] = tokens
+    values[:, 2] = chars
+    values[:, 3] = quote_symbols
+    values[:, 4] = token_length_sums // tokens
+    values[:, 5:] = counts[:, 6:].astype(np.float64) / chars[:, np.newaxis]
+
+    return values
+
+
+def accumulate_sums(sums, values):
+    """
+    Add the rows of a features matrix to running sums, returns the new sums
+    Rows are added one after the other (as a cumulative sum) so that results are identical to summing values line by line
+    """
+
+    if len(values) == 0:
+        return sums
+
+    values = values.copy()
+    values[0] += sums
+
+    return np.cumsum(values, axis=0)[-1]
+
+
+def discretize_values(values, averages):
+    """
+    Tier indexes of a (lines, features) matrix given the features' averages, with the thresholds of discretize_feature
+    """
+
+    return np.select(
+        [values > averages * 1.5, values < averages, values < averages / 2],
+        [HIGHEST, LOW, LOWEST],
+        HIGH
+    )
+
+
+def discretize_quartiles(values, quartiles):
+    """
+    Tier indexes of a (lines, features) matrix given the features' (features, 3) quartiles:
+    lowest below the first quartile, low below the median, highest above the third quartile and high otherwise
+    """
+
+    return np.select(
+        [values < quartiles[:, 0], values < quartiles[:, 1], values > quartiles[:, 2]],
+        [LOWEST, LOW, HIGHEST],
+        HIGH
+    )
+
+
+def tier_tokens(names):
+    """
+    Discrete features (names) => tier index => token
+    """
+
+    return [["{0}_{1}".format(name, tier).replace("#", "\\#") for tier in TIERS] for name in names]
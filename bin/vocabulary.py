@@ -0,0 +1,174 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+:Name:
+    vocabulary.py
+
+:Authors:
+    Soufian Salim (soufi@nsal.im)
+"""
+
+import codecs
+import numpy as np
+import os
+
+
+class Vocabulary(object):
+    """
+    Maps lowercased tokens to integer ids (in order of first appearance), along with their occurrences in the whole corpus
+    If a path is given, the tokens and counts of a previously saved vocabulary are loaded
+    """
+
+    def __init__(self, path=None):
+        self.ids = {} # token => id
+        self.tokens = [] # id => token
+
+        self.counts = TokenCounts(self) # occurrences in the whole corpus
+
+        if path and os.path.exists(path):
+            with codecs.open(path, "r") as vocabulary_file:
+                tokens, counts = [], []
+
+                for line in vocabulary_file:
+                    token, count = line.rstrip("\n").split("\t")
+
+                    tokens.append(token)
+                    counts.append(int(count))
+
+            self.counts.add_counts(self.add(tokens), counts)
+
+    def __len__(self):
+        return len(self.tokens)
+
+    def lookup(self, tokens):
+        """
+        Returns the ids of the given tokens (-1 for unknown tokens)
+        """
+
+        return np.array([self.ids.get(token.lower(), -1) for token in tokens], dtype=np.int64)
+
+    def add(self, tokens):
+        """
+        Returns the ids of the given tokens, unknown tokens being added to the vocabulary
+        """
+
+        ids = np.empty(len(tokens), dtype=np.int64)
+
+        for i, token in enumerate(tokens):
+            token = token.lower()
+            token_id = self.ids.get(token)
+
+            if token_id is None:
+                token_id = self.ids[token] = len(self.tokens)
+                self.tokens.append(token)
+
+            ids[i] = token_id
+
+        return ids
+
+    def save(self, path):
+        """
+        Write the tokens and their occurrences in the whole corpus as tab-separated lines, in id order
+        """
+
+        folder = os.path.dirname(path)
+
+        if folder and not os.path.exists(folder):
+            os.makedirs(folder)
+
+        counts = self.counts.array_of(len(self))
+
+        with codecs.open(path, "w") as out:
+            for token, count in zip(self.tokens, counts.tolist()):
+                out.write("{0}\t{1}\n".format(token, count))
+
+
+class TokenCounts(object):
+    """
+    Occurrences of the tokens of a vocabulary in part of the corpus (the training files of a fold, a single file...),
+    stored in an array indexed by token id
+    """
+
+    def __init__(self, vocabulary):
+        self.vocabulary = vocabulary
+        self.array = np.zeros(0, dtype=np.int64) # token id => occurrences
+        self.total = 0 # number of counted tokens
+
+    def array_of(self, size):
+        """
+        Returns the counts array, grown to at least the given size
+        """
+
+        if len(self.array) < size:
+            self.array = np.concatenate([self.array, np.zeros(max(size, 2 * len(self.array)) - len(self.array), dtype=np.int64)])
+
+        return self.array
+
+    def add(self, tokens):
+        """
+        Count the occurrences of the given tokens, returns their ids
+        """
+
+        ids = self.vocabulary.add(tokens)
+
+        self.add_counts(ids, np.ones(len(ids), dtype=np.int64))
+
+        return ids
+
+    def add_counts(self, ids, counts):
+        """
+        Add counts to the given token ids
+        """
+
+        np.add.at(self.array_of(len(self.vocabulary)), ids, counts)
+
+        self.total += int(np.sum(counts))
+
+    def update(self, other, sign=1):
+        """
+        Add (or, if sign is -1, subtract) the counts of other token counts of the same vocabulary
+        """
+
+        self.array_of(len(other.array))[:len(other.array)] += sign * other.array
+        self.total += sign * other.total
+
+    def copy(self):
+        """
+        Returns independent counts with the same values
+        """
+
+        copy = TokenCounts(self.vocabulary)
+        copy.update(self)
+
+        return copy
+
+    def lookup(self, tokens):
+        """
+        Returns the number of occurrences of each of the given tokens
+        """
+
+        ids = self.vocabulary.lookup(tokens)
+        known = ids >= 0
+
+        counts = np.zeros(len(ids), dtype=np.int64)
+        counts[known] = self.array_of(len(self.vocabulary))[ids[known]]
+
+        return counts
+
+    def frequent_tokens(self, min_occurrences):
+        """
+        Tokens that occur more than min_occurrences times
+        """
+
+        counts = self.array_of(len(self.vocabulary))[:len(self.vocabulary)]
+
+        return set(self.vocabulary.tokens[i] for i in np.flatnonzero(counts > min_occurrences).tolist())
+
+    def iteritems(self):
+        """
+        Yields the counted tokens and their number of occurrences
+        """
+
+        for i in np.flatnonzero(self.array).tolist():
+            yield self.vocabulary.tokens[i], int(self.array[i])
@@ -0,0 +1,235 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+:Name:
+    wapiti.py
+
+:Authors:
+    Soufian Salim (soufi@nsal.im)
+"""
+
+import errno
+import os
+import re
+import subprocess
+import sys
+import threading
+import time
+
+
+WAPITI = "wapiti" # wapiti executable
+
+STDIN = "/dev/stdin" # wapiti reads stdin when no input file is given, but the model file of "wapiti train" comes after it
+
+ITERATION = re.compile(r"\[\s*(\d+)\]\s+obj=(\S+)") # progress line of an optimization iteration ("  [  12] obj=1234.56  act=...")
+
+
+def training_command(pattern_file, data_file, model_file, threads=None, executable=WAPITI):
+    """
+    Command line training a model on a datafile, with the given number of threads (wapiti's default if None)
+    """
+
+    command = [executable, "train", "-p", pattern_file]
+
+    if threads is not None:
+        command.extend(["-t", str(threads)])
+
+    return command + [data_file, model_file]
+
+
+def train(pattern_file, data_file, model_file, threads=None, executable=WAPITI, report=None):
+    """
+    Trains a model on a datafile, returns wapiti's exit status
+    """
+
+    return finish(spawn("train", training_command(pattern_file, data_file, model_file, threads, executable)), report)
+
+
+def start_training(pattern_file, model_file, threads=None, executable=WAPITI):
+    """
+    Starts training a model on the data written to the returned process' stdin
+    """
+
+    return spawn("train", training_command(pattern_file, STDIN, model_file, threads, executable), stdin=subprocess.PIPE)
+
+
+def finish_training(process, report=None):
+    """
+    Waits for a training process to end once all of its data was written
+    """
+
+    process.stdin.close()
+
+    if finish(process, report) != 0:
+        raise subprocess.CalledProcessError(process.returncode, "wapiti train")
+
+
+def label(model_file, data, scores=True, posterior=True, executable=WAPITI, report=None):
+    """
+    Labels test data with a model, returns wapiti's output
+    """
+
+    command = [executable, "label", "-m", model_file]
+
+    if scores:
+        command.append("-s")
+
+    if posterior:
+        command.append("-p")
+
+    process = spawn("label", command, stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+    output = exchange(process, data)
+
+    if finish(process, report) != 0:
+        raise subprocess.CalledProcessError(process.returncode, "wapiti label")
+
+    return output
+
+
+def label_file(model_file, data_file, result_file, executable=WAPITI, report=None):
+    """
+    Labels a test datafile with a model into a result file (with scores and posterior probabilities), returns wapiti's exit status
+    """
+
+    return finish(spawn("label", [executable, "label", "-m", model_file, "-s", "-p", data_file, result_file]), report)
+
+
+def check_file(model_file, gold_file, executable=WAPITI, report=None):
+    """
+    Labels a gold datafile with a model, wapiti displays the errors, returns its exit status
+    """
+
+    return finish(spawn("check", [executable, "label", "-m", model_file, "-p", "-c", gold_file]), report)
+
+
+def check(model_file, data, executable=WAPITI, report=None):
+    """
+    Labels gold data with a model, wapiti displays the errors
+    """
+
+    process = spawn("check", [executable, "label", "-m", model_file, "-p", "-c"], stdin=subprocess.PIPE)
+    exchange(process, data)
+
+    if finish(process, report) != 0:
+        raise subprocess.CalledProcessError(process.returncode, "wapiti label")
+
+
+def spawn(run, command, stdin=None, stdout=None):
+    """
+    Starts a wapiti process, followed by a monitor until it is finished
+    """
+
+    process = subprocess.Popen(command, stdin=stdin, stdout=stdout, stderr=subprocess.PIPE)
+    process.monitor = Monitor(run, command, process)
+
+    return process
+
+
+def exchange(process, data):
+    """
+    Writes data to a process' stdin while reading its stdout, if it is piped (unlike communicate, the process is not waited for)
+    """
+
+    output = []
+
+    if process.stdout is not None:
+        reader = threading.Thread(target=lambda: output.append(process.stdout.read()))
+        reader.start()
+
+    try:
+        process.stdin.write(data)
+    except IOError as e:
+        if e.errno != errno.EPIPE: # the process ended early, its exit status tells why
+            raise
+    finally:
+        process.stdin.close()
+
+    if process.stdout is not None:
+        reader.join()
+
+        return output[0]
+
+
+def finish(process, report=None):
+    """
+    Waits for a process started by spawn to end, returns its exit status
+    Its metrics are appended to report, if any
+    """
+
+    metrics = process.monitor.wait()
+
+    if report is not None:
+        report.append(metrics)
+
+    return process.returncode
+
+
+class Monitor(object):
+    """
+    Measures the wall time, cpu time and peak memory of a wapiti process,
+    and follows its progress messages (which are still displayed) for the number of iterations and the final objective of a training
+    """
+
+    def __init__(self, run, command, process):
+        self.run = run # "train", "label" or "check"
+        self.command = command
+        self.process = process
+
+        self.started = time.time()
+
+        self.iterations = 0
+        self.objective = None
+
+        self.reader = threading.Thread(target=self.follow)
+        self.reader.daemon = True
+        self.reader.start()
+
+    def follow(self):
+        """
+        Displays and parses the process' progress messages
+        """
+
+        for line in iter(self.process.stderr.readline, b""):
+            sys.stderr.write(line)
+
+            match = ITERATION.search(line)
+
+            if match:
+                self.iterations = int(match.group(1))
+                self.objective = float(match.group(2))
+
+        self.process.stderr.close()
+
+    def wait(self):
+        """
+        Waits for the process to end (with wait4, which returns the resource usage of this process only), returns its metrics
+        """
+
+        while True:
+            try:
+                pid, status, usage = os.wait4(self.process.pid, 0)
+                break
+            except OSError as e:
+                if e.errno != errno.EINTR:
+                    raise
+
+        wall_time = time.time() - self.started
+
+        self.process.returncode = -os.WTERMSIG(status) if os.WIFSIGNALED(status) else os.WEXITSTATUS(status)
+
+        self.reader.join()
+
+        return {
+            "run": self.run,
+            "command": " ".join(self.command),
+            "started": time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(self.started)),
+            "exit_status": self.process.returncode,
+            "wall_time": wall_time,
+            "user_time": usage.ru_utime,
+            "system_time": usage.ru_stime,
+            "cpu_time": usage.ru_utime + usage.ru_stime,
+            "max_rss_kb": usage.ru_maxrss, # kilobytes on linux
+            "iterations": self.iterations if self.run == "train" else None,
+            "objective": self.objective
+        }
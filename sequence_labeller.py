@@ -17,7 +17,11 @@
 """
 
 import codecs
+import cPickle
+import json
 import math
+import multiprocessing
+import numpy as np
 import operator
 import os
 import re
@@ -26,13 +30,24 @@ import subprocess
 import sys
 import time
 
+from bin import wapiti
+from bin.feature_schema import make_schema, save_schema, load_schema, write_patterns, hinge_feature_name, HINGE_POSITIONS, HINGE_FORMS
+from bin.folds import FileList, FoldAssignment, hash_order
+from bin.labelling_worker import LabellingClient, LabellingWorker
+from bin.manifest import update_manifest, query_manifest
+from bin.ngram_matcher import NgramMatcher
+from bin.scheduler import FoldScheduler
+from bin.stylistic import analyze_line
+from bin.lemmatization import LemmaCache, coarse_pos
+from bin.tagging import TagCache
+from bin.text_tiling_store import TextTilingStore
+from bin.vocabulary import Vocabulary, TokenCounts
 from collections import Counter
-from nltk import pos_tag
+from cStringIO import StringIO
 from nltk.classify import SklearnClassifier
 from nltk.metrics.scores import accuracy
 from nltk.metrics.segmentation import windowdiff, ghd, pk
 from nltk.probability import FreqDist
-from nltk.stem.wordnet import WordNetLemmatizer
 from optparse import OptionParser
 from progressbar import ProgressBar
 from sklearn import metrics
@@ -45,14 +60,20 @@ ONLY_UTF8 = True # filter out payloads not encoded in utf-8
 ONLY_TEXT_PLAIN = True # filter out xml and html payloads
 FILTER_OBSERVATIONS = False # ignores multiple consecutive observations with "I" label in training
 OCCURRENCE_THRESHOLD_QUOTIENT = 0.075 # ignores words which occur less than once per (quotient * len(train)) messages
+HOLD_OUT_BUCKETS = 10 # without cross-validation, messages are hashed into n buckets and one of them is held out (i.e. 10%)
 
 # Data
 DATA_FOLDER = "data/email.message.tagged/" # folder where heuristically labelled emails are stored
 TEXT_TILING_FOLDER = "data/TT/ubuntu-users/" # folder where emails labelled by text-tiling are stored
 NGRAM_FILE = "ngrams"
+MANIFEST_FILE = "data/manifest.tsv" # index of the data folder's metadata and file lengths
+TAG_CACHE_FILE = "var/cache/tags.pickle" # part-of-speech tags of already tagged sentences (shared with bin/dataset_builder.py)
+LEMMA_CACHE_FILE = "var/cache/lemmas.pickle" # lemmas of recently lemmatized tokens (shared with bin/dataset_builder.py)
+LEMMA_CACHE_SIZE = 100000 # maximum number of lemmas kept in memory
+TEXT_TILING_STORE_FILE = "var/cache/text_tiling.labels" # bit-packed text tiling labels of the messages (shared with bin/dataset_builder.py)
 
 # Scores
-HTML_RESULT_FILE = TEXT_RESULT_FILE = None
+HTML_RESULT_FILE = TEXT_RESULT_FILE = WAPITI_REPORT_FILE = None
 
 # BC3
 BC3_TAGGED_FILE = "data/bc3/bc3_tagged"
@@ -61,11 +82,15 @@ BC3_TEXT_TILING_FILE = "data/bc3/bc3_text_tiling"
 
 # Wapiti
 WAPITI_TRAIN_FILE = WAPITI_TEST_FILE = WAPITI_GOLD_FILE = WAPITI_RESULT_FILE = WAPITI_MODEL_FILE = WAPITI_PATTERN_FILE = None
+WAPITI_SCHEMA_FILE = None
+FEATURIZATION_SUFFIX = ".featurization" # appended to a model's path: statistics its training data was featurized with
 
 # Constants
 
 ngrams = []
 
+ngram_matcher = NgramMatcher(ngrams) # matches all ngrams in a single scan of a line
+
 min_occurrences = 0
 
 standard_deviation = standard_average = None
@@ -83,7 +108,53 @@ avg = {
     "proportion_of_numeric_characters": 0
 }
 
-occ = {} # occurrences counter
+vocabulary = Vocabulary() # token ids, shared by all folds
+
+token_counts = None # occurrences of tokens in the training files of the current fold
+
+file_statistics = {} # (filename, filter_observations) => (token ids, token counts, visual features' sums, instances), computed once for all folds
+
+corpus_statistics = None # (filenames, token counts, visual features' sums, instances) of the files of all folds
+
+message_cache = None # path => featurized observations of a message, if messages are featurized once for all folds
+
+line_analyses = None # tokens => stylistic analysis of the (filtered) observations of cached messages, if messages are featurized once
+
+# names and types of visual features, in column order
+VISUAL_FEATURES = [
+    ("position", "real"),
+    ("number_of_tokens", "integer"),
+    ("number_of_characters", "integer"),
+    ("number_of_quote_symbols", "integer"),
+    ("average_token_length", "real"),
+    ("proportion_of_uppercase_characters", "real"),
+    ("proportion_of_alphabetic_characters", "real"),
+    ("proportion_of_numeric_characters", "real"),
+    ("has_question_mark", "{TRUE, FALSE}"),
+    ("ends_with_question_mark", "{TRUE, FALSE}"),
+    ("has_colon", "{TRUE, FALSE}"),
+    ("ends_with_colon", "{TRUE, FALSE}"),
+    ("has_semicolon", "{TRUE, FALSE}"),
+    ("ends_with_semicolon", "{TRUE, FALSE}"),
+    ("has_early_punctuation", "{TRUE, FALSE}"),
+    ("has_interrogating_word", "{TRUE, FALSE}"),
+    ("starts_with_interrogating_form", "{TRUE, FALSE}"),
+    ("first_verb_form", "string"),
+    ("first_personal_pronoun", "string"),
+    ("contains_modal_word", "{TRUE, FALSE}"),
+    ("contains_plan_phrase", "{TRUE, FALSE}"),
+    ("contains_first_person_mark", "{TRUE, FALSE}"),
+    ("contains_second_person_mark", "{TRUE, FALSE}"),
+    ("contains_third_person_mark", "{TRUE, FALSE}")
+]
+
+schema = None # columns of the datafiles
+
+tag_cache = None # memoized part-of-speech tags
+
+lemma_cache = None # memoized lemmas
+
+text_tiling_labels = None # text tiling labels of the messages, read once
 
 
 # Main
@@ -101,6 +172,9 @@ def main(options, args):
         ngrams = [ngram.strip() for ngram in tuple(codecs.open(NGRAM_FILE, "r"))]
         print("# %d ngrams extracted" % len(ngrams))
 
+        global ngram_matcher
+        ngram_matcher = NgramMatcher(ngrams)
+
     # Makes a copy of the script for future reference
     if options.save:
         print("[{0}] Copying script.py...".format(time.strftime("%H:%M:%S")))
@@ -121,11 +195,41 @@ def main(options, args):
     WAPITI_MODEL_FILE = dirpath + "model"
     WAPITI_PATTERN_FILE = dirpath + "patterns"
 
+    global WAPITI_SCHEMA_FILE
+
+    WAPITI_SCHEMA_FILE = dirpath + "schema.json"
+
     # HTML path
-    global HTML_RESULT_FILE, TEXT_RESULT_FILE
+    global HTML_RESULT_FILE, TEXT_RESULT_FILE, WAPITI_REPORT_FILE
 
     HTML_RESULT_FILE = dirpath + "export.html"
     TEXT_RESULT_FILE = dirpath + "scores.txt"
+    WAPITI_REPORT_FILE = dirpath + "wapiti.jsonl" # resource usage and training progress of each wapiti run
+
+    # Loads part-of-speech tags, lemmas and text tiling labels read during previous runs
+    global tag_cache, lemma_cache, text_tiling_labels
+
+    tag_cache = TagCache(TAG_CACHE_FILE)
+    lemma_cache = LemmaCache(max_size=LEMMA_CACHE_SIZE, path=LEMMA_CACHE_FILE)
+    text_tiling_labels = TextTilingStore(TEXT_TILING_FOLDER, TEXT_TILING_STORE_FILE)
+
+    # Describes the datafiles' columns: datafiles built in a previous run are described by its schema
+    global schema
+
+    if options.build or options.pipe:
+        schema = make_feature_schema(hinge=options.hinge, visual=options.visual)
+        save_schema(schema, WAPITI_SCHEMA_FILE)
+    elif os.path.exists(WAPITI_SCHEMA_FILE):
+        schema = load_schema(WAPITI_SCHEMA_FILE)
+    else:
+        schema = make_feature_schema(hinge=True, visual=True) # datafiles built before schemas existed have all columns
+
+    # Messages are tagged, lemmatized and featurized once, folds only filter and discretize their features
+    if options.featurize_once:
+        global message_cache, line_analyses
+
+        message_cache = {}
+        line_analyses = {}
 
     if options.patterns:
         print("[{0}] Building pattern file...".format(time.strftime("%H:%M:%S")))
@@ -141,7 +245,12 @@ def main(options, args):
         WAPITI_RESULT_FILE += "_"
         WAPITI_MODEL_FILE  += "_"
 
-    if options.build or options.train or options.label or options.check or options.evaluate:
+    if options.build or options.train or options.label or options.check or options.evaluate or options.pipe:
+        # folds are built one after the other, but up to n folds are trained, labelled and evaluated concurrently
+        scheduler = FoldScheduler(options.jobs, options.cpus)
+
+        reports = {} # fold => metrics of its wapiti runs
+
         # for each fold (if any), a training and a testing dataset are computed
         for fold, (train_files, test_files) in enumerate(generate_k_pairs(
                 options.bc3, options.maximum, options.folds, 
@@ -156,36 +265,80 @@ def main(options, args):
                 WAPITI_GOLD_FILE = update_filename(WAPITI_GOLD_FILE, fold)
                 WAPITI_RESULT_FILE = update_filename(WAPITI_RESULT_FILE, fold)
                 WAPITI_MODEL_FILE = update_filename(WAPITI_MODEL_FILE, fold)
-            
-            if options.build:
-                print("[{0}] Building datafiles...".format(time.strftime("%H:%M:%S")))
 
+            # on small corpora, hashing may hold out no message in a fold, which cannot be evaluated
+            if not options.bc3 and options.folds > 0 and len(test_files) == 0:
+                print("# no message is held out in fold {0}, skipped".format(fold + 1))
+                continue
+
+            # progress messages of concurrent folds are prefixed by their fold
+            prefix = "Fold {0}/{1}: ".format(fold + 1, options.folds) if options.jobs > 1 else ""
+
+            reports[fold] = []
+
+            if options.pipe:
                 global min_occurrences
                 min_occurrences = len(train_files) * OCCURRENCE_THRESHOLD_QUOTIENT
 
-                make_datafiles(train_files, test_files, options.bc3, filter_observations=True)
+                scheduler.reserve() # the training process is started before the data is built
 
-            if options.train:
-                print("[{0}] Training model...".format(time.strftime("%H:%M:%S")))
-                subprocess.call("wapiti train -p {0} {1} {2}".format(WAPITI_PATTERN_FILE, WAPITI_TRAIN_FILE, WAPITI_MODEL_FILE), shell=True)
+                print("[{0}] Building datafiles (streamed to wapiti)...".format(time.strftime("%H:%M:%S")))
 
-            if options.label:
-                print("[{0}] Applying model on test data...".format(time.strftime("%H:%M:%S")))
-                subprocess.call("wapiti label -m {0} -s -p {1} {2}".format(WAPITI_MODEL_FILE, WAPITI_TEST_FILE, WAPITI_RESULT_FILE) , shell=True)
+                pipeline = start_pipeline(train_files, test_files, WAPITI_MODEL_FILE, options.bc3, threads=scheduler.wapiti_threads)
 
-            if options.check:
-                print("[{0}] Checking results...".format(time.strftime("%H:%M:%S")))
-                subprocess.call("wapiti label -m {0} -p -c {1}".format(WAPITI_MODEL_FILE, WAPITI_GOLD_FILE), shell=True)
+                save_featurization(WAPITI_MODEL_FILE + FEATURIZATION_SUFFIX)
 
-            if options.evaluate:
-                print("[{0}] Computing scores...".format(time.strftime("%H:%M:%S")))
-                evaluation = evaluate_segmentation(bc3=options.bc3)
-                scores.append(evaluation)
-                write_evaluation(fold, evaluation)
+                scheduler.submit(fold, finish_pipeline, pipeline, WAPITI_MODEL_FILE, options.bc3, options.check, reports[fold], prefix)
+            else:
+                if options.build:
+                    print("[{0}] Building datafiles...".format(time.strftime("%H:%M:%S")))
+
+                    min_occurrences = len(train_files) * OCCURRENCE_THRESHOLD_QUOTIENT
+
+                    make_datafiles(train_files, test_files, options.bc3, filter_observations=True)
+
+                    save_featurization(WAPITI_MODEL_FILE + FEATURIZATION_SUFFIX)
+
+                if options.train or options.label or options.check or options.evaluate:
+                    scheduler.reserve()
+
+                    scheduler.submit(
+                        fold, run_wapiti, 
+                        WAPITI_TRAIN_FILE, WAPITI_TEST_FILE, WAPITI_GOLD_FILE, WAPITI_RESULT_FILE, WAPITI_MODEL_FILE, 
+                        options, scheduler.wapiti_threads, reports[fold], prefix
+                    )
 
             if options.bc3:
                 break;
 
+        # scores and metrics are written in fold order once all folds have ended
+        for fold, evaluation in scheduler.wait():
+            if evaluation is not None:
+                scores.append(evaluation)
+                write_evaluation(fold, evaluation)
+
+        for fold, report in sorted(reports.iteritems()):
+            write_wapiti_report(fold, report)
+
+        # featurized messages and their analyses are only needed by the folds
+        message_cache = line_analyses = None
+
+        # saves part-of-speech tags, lemmas and text tiling labels for future runs
+        tag_cache.save()
+        lemma_cache.save()
+        text_tiling_labels.save()
+
+        if options.build or options.pipe:
+            print("# lemma cache: {0}".format(lemma_cache.statistics()))
+
+    # labelling of new messages by a model of the experiment, whose wapiti process stays loaded
+    if options.segment:
+        print("[{0}] Segmenting messages...".format(time.strftime("%H:%M:%S")))
+
+        model_file = dirpath + "model" + ("_{0}".format(options.model_fold) if not options.bc3 and options.folds > 1 else "")
+
+        segment_messages(args[1:], model_file, socket_file=options.worker_socket)
+
     # evaluation of a segmentation's impact on a bag-of-word classification task
     if options.bow:
         evaluate_bow()
@@ -196,7 +349,7 @@ def main(options, args):
         for filename in os.listdir("var"):
             print("# %s" % filename)
 
-    if options.evaluate:
+    if options.evaluate or options.pipe:
         display_evaluations(scores)
 
 
@@ -205,47 +358,21 @@ def update_filename(s, i):
     return s[:s.rfind("_") + 1] + str(i)
 
 
-# Generates k (train, test) pairs of filename listsfrom the data
+# Generates k (train, test) pairs of filename lists from the data, messages being assigned to folds by a hash of their message id
 def generate_k_pairs(bc3, limit, folds, only_initial=False, only_utf8=False, only_text_plain=False):
-    data = []
-    lengths = []
-
-    progress = ProgressBar()
-
     print("# selecting data files...")
 
-    # iterates through files in the data folder
-    for filename in progress(os.listdir(DATA_FOLDER)):
-        if len(data) == limit:
-            break
-
-        # reads and splits a file into lines
-        lines = codecs.open(DATA_FOLDER + filename, "r").readlines()
-
-        for line in lines:
-            # "#" prefixed lines contain metadata
-            if line.startswith("#"):
-                metadata = line[2:].split("\t")
-
-                if len(metadata) == 8:
-                    # message_id = metadata[0]
-                    mime = metadata[1]
-                    encoding = metadata[2]
-                    is_initial = metadata[3]
-                    # from_address = metadata[4]
-                    # from_personal = metadata[5]
-                    # to_address = metadata[6]
-                    # to_personal = metadata[7]
+    # metadata and file lengths are read from the manifest instead of scanning the data folder
+    manifest, filenames = update_manifest(DATA_FOLDER, MANIFEST_FILE)
 
-                    if (is_initial != "true" and only_initial) or (encoding != "UTF-8" and only_utf8) or (mime != "text/plain" and only_text_plain):
-                        break
-
-                    data.append(filename)
-                    lengths.append(len(lines))
+    # the first messages of the data folder's listing would not be the same on every machine, so a limited selection is made in hash order
+    data = query_manifest(
+        manifest, hash_order(manifest, filenames),
+        limit=limit,
+        only_initial=only_initial, only_utf8=only_utf8, only_text_plain=only_text_plain
+    )
 
-                    break
-            else:
-                break
+    lengths = [manifest[filename].line_count for filename in data]
 
     global standard_deviation, standard_average
 
@@ -255,246 +382,562 @@ def generate_k_pairs(bc3, limit, folds, only_initial=False, only_utf8=False, onl
     print("# dataset size: {0} ({1} requested)".format(len(data), limit))
 
     if bc3:
-        yield data, [BC3_TAGGED_FILE]
+        yield FileList(data), FileList([BC3_TAGGED_FILE])
     elif folds == 0:
-        yield [], []
+        yield FileList(), FileList()
     elif folds == 1:
-        max_train = int(float(len(data)) * 0.9);
-        yield data[:max_train], data[max_train:]
+        yield FoldAssignment(manifest, data, HOLD_OUT_BUCKETS).split(0)
     else:
-        for k in xrange(folds):
-            train = [x for i, x in enumerate(data) if i % folds != k]
-            test = [x for i, x in enumerate(data) if i % folds == k]
+        assignment = FoldAssignment(manifest, data, folds)
 
-            yield train, test
+        if assignment.round_robin:
+            print("# hashing left folds empty, messages were dealt to folds in hash order")
 
+        print("# fold sizes: {0}".format(", ".join(str(size) for size in assignment.sizes())))
 
-# Writes wapiti datafiles
-def make_datafiles(train_files, test_files, bc3=False, filter_observations=False):
-    skipped = 0 # skipped emails counter
-
-    with codecs.open(WAPITI_TRAIN_FILE, "w") as train_out:
-        with codecs.open(WAPITI_TEST_FILE, "w") as test_out:
-            with codecs.open(WAPITI_GOLD_FILE, "w") as gold_out:
-                preprocess(train_files, filter_observations) # preprocessing...
-               
-                print("# building train, test and gold datafiles...")
-               
-                wnl = WordNetLemmatizer()
-
-                progress = ProgressBar(maxval=len(train_files + test_files)).start()
+        for k in xrange(folds):
+            yield assignment.split(k)
 
-                # iterates over email.message.tagged files
-                for i, filename in enumerate(train_files + test_files):
-                    progress.update(i)
 
-                    prev_label = next_label = None
-                   
-                    # if not building train file, checks if the gold and test files should be made from the bc3 corpus
-                    lines = codecs.open(DATA_FOLDER + filename, "r").readlines() if not (
-                        bc3 and filename in test_files
-                    ) else codecs.open(BC3_TAGGED_FILE, "r").readlines()
+# Builds a fold without datafiles: train data is streamed to a wapiti training process, test and gold data are kept in memory
+def start_pipeline(train_files, test_files, model_file, bc3=False, threads=None):
+    train_labels = []
+    test_out = StringIO()
+    gold_out = StringIO()
 
-                    # heuristic: messages of more than n lines are ignored in order to avoid large copy/pasted content such as command outputs
-                    if len(lines) > standard_deviation + standard_average and not (filename in test_files and bc3):
-                        skipped += 1
-                        continue
+    trainer = wapiti.start_training(WAPITI_PATTERN_FILE, model_file, threads=threads)
 
-                    for line_number, line in enumerate(lines):
-                        line = line.strip()
+    write_datafiles(trainer.stdin, test_out, gold_out, train_files, test_files, bc3, filter_observations=True, train_labels=train_labels)
 
-                        if not line.startswith("#"): # ignores file header
-                            tokens = line.split()
+    return trainer, train_labels, test_out.getvalue(), gold_out.getvalue()
 
-                            # ignores tokens with a low number of occurrences
-                            if min_occurrences > 0:
-                                for token in tokens[1:]:
-                                    if not token.lower() in occ or occ[token.lower()] < min_occurrences:
-                                        tokens.remove(token)
 
-                            if len(tokens) == 1:
-                                tokens.append("@NULL")
+# Trains, labels and evaluates a fold built by start_pipeline (may run concurrently with other folds)
+def finish_pipeline(pipeline, model_file, bc3=False, check=False, report=None, prefix=""):
+    trainer, train_labels, test_data, gold_data = pipeline
 
-                            if len(tokens) > 1:
-                                raw_label = tokens.pop(0) # "B", "I", "E", "BE"
-                                label = "T" if raw_label == "B" or raw_label == "BE" or raw_label =="T" else "F" # "T" or "F"
-                                next_label = None
+    print("[{0}] {1}Training model...".format(time.strftime("%H:%M:%S"), prefix))
+    wapiti.finish_training(trainer, report=report)
 
-                                if len(lines) > line_number + 1:
-                                    next_line = lines[line_number + 1].split()
-                                    if len(next_line) > 1:
-                                        next_label = next_line.pop(0)
+    print("[{0}] {1}Applying model on test data...".format(time.strftime("%H:%M:%S"), prefix))
+    result_lines = wapiti.label(model_file, test_data, report=report).splitlines(True)
 
-                                if raw_label != "I" or not filter_observations or not filename in train_files or raw_label != prev_label or raw_label != next_label:
-                                    tokens_lemmas_tags = [
-                                        (token, wnl.lemmatize(clear_numbers(token.lower()), "v" if tag.startswith("V") else "n"), tag) 
-                                            for token, tag in pos_tag(tokens)
-                                    ]
+    gold_lines = gold_data.splitlines(True)
 
-                                    features = ""
+    if check:
+        print("[{0}] {1}Checking results...".format(time.strftime("%H:%M:%S"), prefix))
+        wapiti.check(model_file, gold_data, report=report)
 
-                                    for j in [0, 1, 2, -3, -2, -1]:
-                                        if j >= len(tokens_lemmas_tags) or j < len(tokens_lemmas_tags) * -1:
-                                            features += "@NULL\t@NULL\t@NULL\t"
-                                        else:
-                                            token, lemma, tag = tokens_lemmas_tags[j]
+    print("[{0}] {1}Computing scores...".format(time.strftime("%H:%M:%S"), prefix))
 
-                                            features += "{0}\t{1}\t{2}\t".format(token, lemma, tag)
+    d = "".join(train_labels).replace("F", ".") # training data (as read by data_to_list)
+    g = "".join(lines_to_list(gold_lines)) # gold string
+    temp_r = lines_to_list(result_lines) # result string
 
-                                    for vf in build_visual_features(tokens_lemmas_tags, line_number + 1, len(lines)):
-                                        features += "{0}\t".format(vf)
+    if bc3:
+        t = data_to_list(BC3_TEXT_TILING_FILE, label_position=0) # text tiling baseline string
+    else:
+        t = lines_to_list(gold_lines, label_position=-2)
 
-                                    # getting the corresponding text tiling label
-                                    tt_lines = codecs.open(TEXT_TILING_FOLDER + filename, "r").readlines()
-                                    tt_line = tt_lines[line_number - 3]
-                                    tt_label = tt_line.strip().split().pop(0)
+    return evaluate_labels(d, g, temp_r, t)
 
-                                    for ngram in ngrams:
-                                        ngram_feature = "TRUE" if line.count(ngram) > 0 else "FALSE"
-                                        features += "{0}\t".format(ngram_feature)
 
-                                    features += "{0}\t".format(tt_label)
+# Trains, labels, checks and evaluates a fold from its datafiles (may run concurrently with other folds), returns its scores if evaluated
+def run_wapiti(train_file, test_file, gold_file, result_file, model_file, options, threads=None, report=None, prefix=""):
+    if options.train:
+        print("[{0}] {1}Training model...".format(time.strftime("%H:%M:%S"), prefix))
+        wapiti.train(WAPITI_PATTERN_FILE, train_file, model_file, threads=threads, report=report)
 
-                                    if filename in train_files:
-                                        train_out.write("{0}{1}\n".format(features, label))
-                                    else:
-                                        gold_out.write("{0}{1}\n".format(features, label))
-                                        test_out.write("{0}\n".format(features))
+    if options.label:
+        print("[{0}] {1}Applying model on test data...".format(time.strftime("%H:%M:%S"), prefix))
+        wapiti.label_file(model_file, test_file, result_file, report=report)
 
-                                prev_label = raw_label
+    if options.check:
+        print("[{0}] {1}Checking results...".format(time.strftime("%H:%M:%S"), prefix))
+        wapiti.check_file(model_file, gold_file, report=report)
 
-                    if filename in train_files:
-                        train_out.write("\n")
-                    else:
-                        gold_out.write("\n")
-                        test_out.write("\n")
+    if options.evaluate:
+        print("[{0}] {1}Computing scores...".format(time.strftime("%H:%M:%S"), prefix))
+        return evaluate_segmentation(train_file, gold_file, result_file, bc3=options.bc3)
 
-                progress.finish()
 
-    print("# {0} messages were ignored (over standard deviation length plus average length, i.e. {1} + {2} = {3})".format(
-        skipped, standard_deviation, standard_average, standard_deviation + standard_average)
-    )
+# Writes wapiti datafiles
+def make_datafiles(train_files, test_files, bc3=False, filter_observations=False):
+    with codecs.open(WAPITI_TRAIN_FILE, "w") as train_out:
+        with codecs.open(WAPITI_TEST_FILE, "w") as test_out:
+            with codecs.open(WAPITI_GOLD_FILE, "w") as gold_out:
+                write_datafiles(train_out, test_out, gold_out, train_files, test_files, bc3, filter_observations)
 
 
-# Preprocessing
-def preprocess(files, filter_observations):
-    print("# preprocessing...")
+# Writes train, test and gold data to the given outputs (the labels written to train data are appended to train_labels, if given)
+def write_datafiles(train_out, test_out, gold_out, train_files, test_files, bc3=False, filter_observations=False, train_labels=None):
+    skipped = 0 # skipped emails counter
+    groups = set(group["name"] for group in schema["groups"]) # feature groups written to the datafiles
 
-    global occ # token occurrence counter
+    preprocess(train_files, test_files if not bc3 else [], filter_observations) # preprocessing...
+   
+    print("# building train, test and gold datafiles...")
 
-    progress = ProgressBar(maxval=len(files)).start()
+    progress = ProgressBar(maxval=len(train_files + test_files)).start()
 
     # iterates over email.message.tagged files
-    for i, filename in enumerate(files):
+    for i, filename in enumerate(train_files + test_files):
         progress.update(i)
 
         prev_label = next_label = None
        
-        lines = codecs.open(DATA_FOLDER + filename, "r").readlines()
+        # if not building train file, checks if the gold and test files should be made from the bc3 corpus
+        lines = codecs.open(DATA_FOLDER + filename, "r").readlines() if not (
+            bc3 and filename in test_files
+        ) else codecs.open(BC3_TAGGED_FILE, "r").readlines()
+
+        # heuristic: messages of more than n lines are ignored in order to avoid large copy/pasted content such as command outputs
+        if len(lines) > standard_deviation + standard_average and not (filename in test_files and bc3):
+            skipped += 1
+            continue
+
+        if message_cache is not None:
+            write_cached_message(
+                train_out, test_out, gold_out, lines, filename, train_files, test_files, bc3, filter_observations, groups, train_labels
+            )
+            continue
+
+        # all of the message's observations are tagged in a single batch
+        tag_cache.prefetch([tokens for tokens in map(observation_tokens, lines) if tokens is not None])
 
         for line_number, line in enumerate(lines):
             line = line.strip()
 
             if not line.startswith("#"): # ignores file header
                 tokens = line.split()
+
+                # ignores tokens with a low number of occurrences
+                if min_occurrences > 0:
+                    remove_rare_tokens(tokens)
+
+                if len(tokens) == 1:
+                    tokens.append("@NULL")
+
                 if len(tokens) > 1:
                     raw_label = tokens.pop(0) # "B", "I", "E", "BE"
+                    label = "T" if raw_label == "B" or raw_label == "BE" or raw_label =="T" else "F" # "T" or "F"
                     next_label = None
 
-                    for token in tokens:
-                        if token.lower() in occ:
-                            occ[token.lower()] += 1
-                        else:
-                            occ[token.lower()] = 1
-
                     if len(lines) > line_number + 1:
                         next_line = lines[line_number + 1].split()
                         if len(next_line) > 1:
                             next_label = next_line.pop(0)
 
-                    if raw_label != "I" or not filter_observations or raw_label != prev_label or raw_label != next_label:
-                        update_average_visual_features(tokens, line_number + 1, len(lines))
+                    if raw_label != "I" or not filter_observations or not filename in train_files or raw_label != prev_label or raw_label != next_label:
+                        tokens_lemmas_tags = tag_and_lemmatize(tokens)
+
+                        # getting the corresponding text tiling label
+                        tt_label = text_tiling_labels.label(filename, line_number - 3)
+
+                        features = make_features(tokens_lemmas_tags, line_number + 1, len(lines), tt_label, ngram_matcher.match(line), groups)
+
+                        write_observation(train_out, test_out, gold_out, features, label, filename in train_files, train_labels)
 
                     prev_label = raw_label
 
+        if filename in train_files:
+            train_out.write("\n")
+        else:
+            gold_out.write("\n")
+            test_out.write("\n")
+
     progress.finish()
 
+    print("# {0} messages were ignored (over standard deviation length plus average length, i.e. {1} + {2} = {3})".format(
+        skipped, standard_deviation, standard_average, standard_deviation + standard_average)
+    )
+
+
+# Writes the observations of a message featurized once for all folds: its tokens were tagged and lemmatized before rare tokens are filtered
+def write_cached_message(train_out, test_out, gold_out, lines, filename, train_files, test_files, bc3, filter_observations, groups, train_labels=None):
+    path = DATA_FOLDER + filename if not (bc3 and filename in test_files) else BC3_TAGGED_FILE
+
+    if path not in message_cache:
+        message_cache[path] = featurize_message(lines, filename)
+
+    prev_label = None
+
+    for raw_label, next_label, tokens, tokens_lemmas_tags, line_number, tt_label, matched_ngrams in message_cache[path]:
+        label = "T" if raw_label == "B" or raw_label == "BE" or raw_label =="T" else "F" # "T" or "F"
+
+        if raw_label != "I" or not filter_observations or not filename in train_files or raw_label != prev_label or raw_label != next_label:
+            # ignores tokens with a low number of occurrences
+            if min_occurrences > 0:
+                frequent = token_counts.lookup(tokens) >= min_occurrences
+                tokens_lemmas_tags = [token_lemma_tag for token_lemma_tag, is_frequent in zip(tokens_lemmas_tags, frequent) if is_frequent]
+
+            if len(tokens_lemmas_tags) == 0:
+                tokens_lemmas_tags = tag_and_lemmatize(["@NULL"])
+
+            # most folds keep the same tokens
+            key = tuple(token for token, lemma, tag in tokens_lemmas_tags)
+
+            if key not in line_analyses:
+                line_analyses[key] = analyze_line(" ".join(key), list(key))
+
+            features = make_features(tokens_lemmas_tags, line_number + 1, len(lines), tt_label, matched_ngrams, groups, line_analyses[key])
+
+            write_observation(train_out, test_out, gold_out, features, label, filename in train_files, train_labels)
+
+        prev_label = raw_label
+
+    if filename in train_files:
+        train_out.write("\n")
+    else:
+        gold_out.write("\n")
+        test_out.write("\n")
+
+
+# Tags, lemmatizes and matches the ngrams of the observations of a message (rare tokens are not filtered)
+def featurize_message(lines, filename):
+    observations = []
+
+    # all of the message's observations are tagged in a single batch
+    tag_cache.prefetch([line.split()[1:] for line in lines if len(line.split()) > 1 and not line.strip().startswith("#")])
+
+    for line_number, line in enumerate(lines):
+        line = line.strip()
+
+        if not line.startswith("#"): # ignores file header
+            tokens = line.split()
+
+            if len(tokens) > 0:
+                raw_label = tokens.pop(0) # "B", "I", "E", "BE"
+                next_label = None
+
+                if len(lines) > line_number + 1:
+                    next_line = lines[line_number + 1].split()
+                    if len(next_line) > 1:
+                        next_label = next_line.pop(0)
+
+                tt_label = text_tiling_labels.label(filename, line_number - 3)
+
+                observations.append((
+                    raw_label, next_label, tokens, tag_and_lemmatize(tokens), line_number, tt_label, ngram_matcher.match(line)
+                ))
+
+    return observations
+
+
+# Returns the (token, lemma, tag) triples of tokens
+def tag_and_lemmatize(tokens):
+    return [
+        (token, lemma_cache.lemmatize(clear_numbers(token.lower()), coarse_pos(tag)), tag) 
+            for token, tag in tag_cache.tag(tokens)
+    ]
+
+
+# Makes the features of an observation, as written to the datafiles (hinge and visual features only if their group is written)
+def make_features(tokens_lemmas_tags, line_number, total_lines, tt_label, matched_ngrams, groups, analysis=None):
+    features = ""
+
+    if "syntactic" in groups:
+        for j in HINGE_POSITIONS:
+            if j >= len(tokens_lemmas_tags) or j < len(tokens_lemmas_tags) * -1:
+                features += "@NULL\t@NULL\t@NULL\t"
+            else:
+                token, lemma, tag = tokens_lemmas_tags[j]
+
+                features += "{0}\t{1}\t{2}\t".format(token, lemma, tag)
+
+    if "stylistic" in groups:
+        for vf in build_visual_features(tokens_lemmas_tags, line_number, total_lines, analysis):
+            features += "{0}\t".format(vf)
+
+    for j in xrange(len(ngrams)):
+        ngram_feature = "TRUE" if j in matched_ngrams else "FALSE"
+        features += "{0}\t".format(ngram_feature)
+
+    features += "{0}\t".format(tt_label)
+
+    return features
+
+
+# Writes an observation to the train data, or to the test and gold data
+def write_observation(train_out, test_out, gold_out, features, label, train, train_labels=None):
+    if train:
+        train_out.write("{0}{1}\n".format(features, label))
+
+        if train_labels is not None:
+            train_labels.append(label)
+    else:
+        gold_out.write("{0}{1}\n".format(features, label))
+        test_out.write("{0}\n".format(features))
+
+
+# Saves the statistics the current fold's datafiles were featurized with, so that new messages can be labelled by its model
+def save_featurization(path):
+    tokens = vocabulary.tokens
+
+    featurization = {
+        "avg": dict(avg),
+        "instances": instances,
+        "ngrams": ngrams,
+        "groups": sorted(group["name"] for group in schema["groups"]),
+        "frequent_tokens": [
+            token for token, is_frequent in zip(tokens, token_counts.lookup(tokens) >= min_occurrences) if is_frequent
+        ] if min_occurrences > 0 else None # None: tokens are not filtered
+    }
+
+    with open(path, "wb") as out:
+        cPickle.dump(featurization, out, cPickle.HIGHEST_PROTOCOL)
+
+
+# Loads the statistics a model's datafiles were featurized with, returns its frequent tokens (None if all are kept) and feature groups
+def load_featurization(path):
+    global avg, instances, ngrams, ngram_matcher
+
+    with open(path, "rb") as featurization_file:
+        featurization = cPickle.load(featurization_file)
+
+    avg = featurization["avg"]
+    instances = featurization["instances"]
+    ngrams = featurization["ngrams"]
+    ngram_matcher = NgramMatcher(ngrams)
+
+    frequent_tokens = featurization["frequent_tokens"]
+
+    return set(frequent_tokens) if frequent_tokens is not None else None, set(featurization["groups"])
+
+
+# Featurizes the lines of a new (unlabelled) message as test observations, each line being an observation
+# Text tiling labels are unknown for new messages: lines are labelled "O" unless labels are given
+def featurize_new_message(lines, frequent_tokens, groups, tt_labels=None):
+    observations = []
+
+    tag_cache.prefetch([line.split() for line in lines if len(line.split()) > 0])
+
+    for line_number, line in enumerate(lines):
+        line = line.strip()
+        tokens = line.split()
+
+        # ignores tokens with a low number of occurrences in the model's training data
+        if frequent_tokens is not None:
+            tokens = [token for token in tokens if token.lower() in frequent_tokens]
+
+        if len(tokens) == 0:
+            tokens.append("@NULL")
+
+        tt_label = tt_labels[line_number] if tt_labels is not None and line_number < len(tt_labels) else "O"
+
+        observations.append(make_features(
+            tag_and_lemmatize(tokens), line_number + 1, len(lines), tt_label, ngram_matcher.match(line), groups
+        ))
+
+    return observations
+
+
+# Labels new messages (one observation per line) with a model trained in a previous run, by a labelling worker that keeps it loaded
+# The worker is started for the run unless the socket of a running worker (bin/labelling_worker.py -s) is given
+def segment_messages(filenames, model_file, socket_file=None):
+    frequent_tokens, groups = load_featurization(model_file + FEATURIZATION_SUFFIX)
+
+    labeller = LabellingClient(socket_file) if socket_file else LabellingWorker(model_file)
+
+    try:
+        for filename in filenames:
+            lines = codecs.open(filename, "r").readlines()
+
+            score, labels = labeller.label(featurize_new_message(lines, frequent_tokens, groups))
+
+            print("# {0} (score: {1})".format(filename, score))
+
+            for line, (label, probability) in zip(lines, labels):
+                print("{0}\t{1:.4f}\t{2}".format(label, probability, line.rstrip("\n")))
+    finally:
+        labeller.close()
+
+
+# Removes tokens with a low number of occurrences (the first token being the label)
+def remove_rare_tokens(tokens):
+    frequent = token_counts.lookup(tokens[1:]) >= min_occurrences
+
+    tokens[1:] = [token for token, is_frequent in zip(tokens[1:], frequent) if is_frequent]
+
+
+# Returns the tokens of a line as passed to the tagger by make_datafiles (None if the line is not an observation)
+def observation_tokens(line):
+    line = line.strip()
+
+    if line.startswith("#"):
+        return None
+
+    tokens = line.split()
+
+    if min_occurrences > 0:
+        remove_rare_tokens(tokens)
+
+    if len(tokens) == 1:
+        tokens.append("@NULL")
+
+    return tokens[1:] if len(tokens) > 1 else None
+
+
+# Preprocessing: statistics of the training files of a fold, i.e. those of all files minus those of the held-out files
+def preprocess(train_files, held_out_files, filter_observations):
+    print("# preprocessing...")
+
+    global corpus_statistics, token_counts, avg, instances
+
+    files = train_files + held_out_files
+
+    # statistics of each file are computed once, the totals are computed again only if the files change
+    if corpus_statistics is None or corpus_statistics[0] != set(files):
+        corpus_token_counts = TokenCounts(vocabulary)
+        corpus_sums = dict.fromkeys(avg, 0.0)
+        corpus_instances = 0
+
+        progress = ProgressBar(maxval=len(files)).start()
+
+        for i, filename in enumerate(files):
+            progress.update(i)
+
+            ids, counts, sums, file_instances = compute_file_statistics(filename, filter_observations)
+
+            corpus_token_counts.add_counts(ids, counts)
+
+            for name, value in sums.iteritems():
+                corpus_sums[name] += value
+
+            corpus_instances += file_instances
+
+        progress.finish()
+
+        corpus_statistics = (set(files), corpus_token_counts, corpus_sums, corpus_instances)
+
+    filenames, corpus_token_counts, corpus_sums, corpus_instances = corpus_statistics
+
+    token_counts = corpus_token_counts.copy()
+    avg = dict(corpus_sums)
+    instances = corpus_instances
+
+    for filename in held_out_files:
+        ids, counts, sums, file_instances = compute_file_statistics(filename, filter_observations)
+
+        token_counts.add_counts(ids, -counts)
+
+        for name, value in sums.iteritems():
+            avg[name] -= value
+
+        instances -= file_instances
+
+
+# Computes (once) the token counts and the visual features' sums of a file
+def compute_file_statistics(filename, filter_observations):
+    key = (filename, filter_observations)
+
+    if key in file_statistics:
+        return file_statistics[key]
+
+    prev_label = next_label = None
+
+    lines = codecs.open(DATA_FOLDER + filename, "r").readlines()
+
+    file_tokens = [] # the file's tokens are counted at once
+    sums = dict.fromkeys(avg, 0.0)
+    file_instances = 0
+
+    for line_number, line in enumerate(lines):
+        line = line.strip()
+
+        if not line.startswith("#"): # ignores file header
+            tokens = line.split()
+            if len(tokens) > 1:
+                raw_label = tokens.pop(0) # "B", "I", "E", "BE"
+                next_label = None
+
+                file_tokens.extend(tokens)
+
+                if len(lines) > line_number + 1:
+                    next_line = lines[line_number + 1].split()
+                    if len(next_line) > 1:
+                        next_label = next_line.pop(0)
+
+                if raw_label != "I" or not filter_observations or raw_label != prev_label or raw_label != next_label:
+                    update_average_visual_features(sums, tokens, line_number + 1, len(lines))
+                    file_instances += 1
+
+                prev_label = raw_label
+
+    # occurrences of each of the file's tokens
+    ids, counts = np.unique(vocabulary.add(file_tokens), return_counts=True)
+
+    file_statistics[key] = (ids, counts, sums, file_instances)
+
+    return file_statistics[key]
+
 
 # Builds visual features
-def build_visual_features(tokens_lemmas_tags, line_number, total_lines):
+def build_visual_features(tokens_lemmas_tags, line_number, total_lines, analysis=None):
     features = []
-    tokens = [token for token, lemma, tag in tokens_lemmas_tags]
-    line = " ".join(tokens)
-    line_lower = line.lower()
+
+    if analysis is None:
+        tokens = [token for token, lemma, tag in tokens_lemmas_tags]
+        analysis = analyze_line(" ".join(tokens), tokens)
    
     # position
     x = float(line_number) / total_lines
     features.append(make_feature("position", x))
 
     # number of tokens
-    x = len(tokens)
+    x = analysis.number_of_tokens
     features.append(make_feature("number_of_tokens", x))
 
     # number of characters
-    x = len(line)
+    x = analysis.number_of_chars
     features.append(make_feature("number_of_characters", x))
 
     # number of quote symbols
-    x = line.count(">")
+    x = analysis.number_of_quote_symbols
     features.append(make_feature("number_of_quote_symbols", x))
 
     # average token length
-    x = sum(map(len, tokens)) / float(len(tokens))
+    x = analysis.token_length_sum / float(analysis.number_of_tokens)
     features.append(make_feature("average_token_length", x))
 
     # proportion of uppercase characters
-    x = float(sum(x.isupper() for x in line)) / len(line)
+    x = float(analysis.number_of_uppercase_chars) / analysis.number_of_chars
     features.append(make_feature("proportion_of_uppercase_characters", x))
 
     # proportion of alphabetic characters
-    x = float(sum(x.isalpha() for x in line)) / len(line)
+    x = float(analysis.number_of_alphabetic_chars) / analysis.number_of_chars
     features.append(make_feature("proportion_of_alphabetic_characters", x))
 
     # proportion of numeric characters
-    x = float(sum(x.isdigit() for x in line)) / len(line)
+    x = float(analysis.number_of_numeric_chars) / analysis.number_of_chars
     features.append(make_feature("proportion_of_numeric_characters", x))
 
     # has question mark
-    features.append("has_question_mark" if line.count("?") > 0 else "no_question_mark")
+    features.append("has_question_mark" if analysis.has_question_mark else "no_question_mark")
 
     # ends with question mark
-    features.append("ends_with_question_mark" if line.endswith("?") else "does_not_end_with_question_mark")
+    features.append("ends_with_question_mark" if analysis.ends_with_question_mark else "does_not_end_with_question_mark")
 
     # has colon
-    features.append("has_colon" if line.count(":") > 0 else "no_colon")
+    features.append("has_colon" if analysis.has_colon else "no_colon")
 
     # ends with colon
-    features.append("ends_with_colon" if line.endswith(":") else "does_not_end_with_colon")
+    features.append("ends_with_colon" if analysis.ends_with_colon else "does_not_end_with_colon")
 
     # has semicolon
-    features.append("has_semicolon" if line.count(";") > 0 else "no_semicolon")
+    features.append("has_semicolon" if analysis.has_semicolon else "no_semicolon")
 
     # ends with semicolon
-    features.append("ends_with_semicolon_mark" if line.endswith(";") else "does_not_end_with_semicolon")
+    features.append("ends_with_semicolon_mark" if analysis.ends_with_semicolon else "does_not_end_with_semicolon")
 
     # has early punctuation
-    first_punctuation_position = 999
-
-    for i, token in enumerate(tokens):
-        if token in [".", ";", ":", "?", "!", ","]:
-            first_punctuation_position = i
-
-    features.append("has_early_punctuation" if first_punctuation_position < 4 else "no_early_punctuation")
+    features.append("has_early_punctuation" if analysis.has_early_punctuation else "no_early_punctuation")
 
     # has interrogating word
-    features.append("has_interrogating_word" if not set([token.lower() for token in tokens]).isdisjoint(
-        ["who", "when", "where", "what", "which", "what", "how"]
-    ) else "no_interrogating_word")
+    features.append("has_interrogating_word" if analysis.has_interrogating_word else "no_interrogating_word")
 
     # starts with interrogating form
-    features.append("starts_with_interrogating_form" if tokens[0].lower() in [
-        "who", "when", "where", "what", "which", "what", "how", "is", "are", "am", "will", "do", "does", "have", "has"
-    ] else "does_not_start_with_interrogating_form")
+    features.append("starts_with_interrogating_form" if analysis.starts_with_interrogating_form else "does_not_start_with_interrogating_form")
 
     # first verb form
     first_verb_form = "NO_VERB"
@@ -507,58 +950,38 @@ def build_visual_features(tokens_lemmas_tags, line_number, total_lines):
     features.append(first_verb_form)
 
     # first personal pronoun
-    first_personal_pronoun = "NO_PERSONAL_PRONOUN"
-
-    for token in tokens:
-        if token.lower() in ["i", "you", "he", "she", "we", "they"]:
-            first_personal_pronoun = token.upper()
-
-    features.append(first_personal_pronoun)
+    features.append(analysis.personal_pronoun or "NO_PERSONAL_PRONOUN")
 
     # contains modal word
-    features.append("contains_modal_word" if any(ngram in line_lower for ngram in [
-        "may", "must", "musn" "shall", "shan" "will", "might", "should", "would", "could"
-    ]) else "does_not_contain_modal_word")
+    features.append("contains_modal_word" if analysis.contains_modal_word else "does_not_contain_modal_word")
 
     # contains plan phrase
-    features.append("contains_plan_phrase" if any(ngram in line_lower for ngram in [
-        "i will", "i am going to", "we will", "we are going to", "i plan to", "we plan to"
-    ]) else "does_not_contain_plan_phrase")
+    features.append("contains_plan_phrase" if analysis.contains_plan_phrase else "does_not_contain_plan_phrase")
 
     # contains first person mark
-    features.append("contains_first_person_mark" if any(ngram in line_lower for ngram in [
-        "me", "us", "i", "we", "my", "mine", "myself", "ourselves"
-    ]) else "does_not_contain_first_person_mark")
+    features.append("contains_first_person_mark" if analysis.contains_first_person_mark else "does_not_contain_first_person_mark")
 
     # contains second person mark
-    features.append("contains_second_person_mark" if any(ngram in line_lower for ngram in [
-        "you", "your", "yours", "yourself", "yourselves"
-    ]) else "does_not_contain_second_person_mark")
+    features.append("contains_second_person_mark" if analysis.contains_second_person_mark else "does_not_contain_second_person_mark")
 
     # contains third person mark
-    features.append("contains_third_person_mark" if any(ngram in line_lower for ngram in [
-        "he", "she", "they", "his", "their", "hers", "him", "her", "them"
-    ]) else "does_not_contain_third_person_mark")
+    features.append("contains_third_person_mark" if analysis.contains_third_person_mark else "does_not_contain_third_person_mark")
 
     return features
 
 
-# Updates average visual features
-def update_average_visual_features(tokens, line_number, total_lines):
-    line = " ".join(tokens)
-
-    global avg, instances
-
-    instances += 1
+# Updates the sums of visual features
+def update_average_visual_features(sums, tokens, line_number, total_lines):
+    analysis = analyze_line(" ".join(tokens), tokens)
 
-    avg["position"]                            += float(line_number) / total_lines
-    avg["number_of_tokens"]                    += len(tokens)
-    avg["number_of_characters"]                += len(line)
-    avg["number_of_quote_symbols"]             += line.count(">")
-    avg["average_token_length"]                += sum(map(len, tokens)) / float(len(tokens))
-    avg["proportion_of_uppercase_characters"]  += float(sum(x.isupper() for x in line)) / len(line)
-    avg["proportion_of_alphabetic_characters"] += float(sum(x.isalpha() for x in line)) / len(line)
-    avg["proportion_of_numeric_characters"]    += float(sum(x.isdigit() for x in line)) / len(line)
+    sums["position"]                            += float(line_number) / total_lines
+    sums["number_of_tokens"]                    += analysis.number_of_tokens
+    sums["number_of_characters"]                += analysis.number_of_chars
+    sums["number_of_quote_symbols"]             += analysis.number_of_quote_symbols
+    sums["average_token_length"]                += analysis.token_length_sum / float(analysis.number_of_tokens)
+    sums["proportion_of_uppercase_characters"]  += float(analysis.number_of_uppercase_chars) / analysis.number_of_chars
+    sums["proportion_of_alphabetic_characters"] += float(analysis.number_of_alphabetic_chars) / analysis.number_of_chars
+    sums["proportion_of_numeric_characters"]    += float(analysis.number_of_numeric_chars) / analysis.number_of_chars
 
 
 # Transforms a numeric value into a string feature
@@ -582,54 +1005,56 @@ def clear_numbers(s):
     return re.sub('[%s]' % string.digits, '#', s)
 
 
-# Computes and writes patterns
-def make_patterns(tt=False, visual=False, hinge=False):
-    progress = ProgressBar(maxval=10).start()
-
-    with codecs.open(WAPITI_PATTERN_FILE, "w") as out:
-        i = 1
-
-        for off in xrange(-2, 3):
-            progress.update(off + 5)
+# Describes the columns of the datafiles (unused hinge and visual features are not written, text tiling labels are always written for evaluation)
+def make_feature_schema(hinge=False, visual=False):
+    groups = []
 
-            off = str(off) if off < 1 else "+" + str(off)
+    if hinge:
+        groups.append(("syntactic", [
+            (hinge_feature_name(position, form), "string") for position in HINGE_POSITIONS for form in HINGE_FORMS
+        ]))
 
-            if hinge:
-                for offset in [0, 9]:
-                    for off_col in xrange(0, 3):
-                        base_col = off_col + offset
+    if visual:
+        groups.append(("stylistic", VISUAL_FEATURES))
 
-                        out.write("*{0}:%x[{1},{2}]\n".format(i, off, base_col)) # unigram 1
-                        i += 1
-                        out.write("*{0}:%x[{1},{2}]\n".format(i, off, base_col + 3)) # unigram 2
-                        i += 1
-                        out.write("*{0}:%x[{1},{2}]\n".format(i, off, base_col + 6)) # unigram 3
-                        i += 1
-                        out.write("*{0}:%x[{1},{2}]/%x[{1},{3}]\n".format(i, off, base_col, base_col + 3)) # bigram 1
-                        i += 1
-                        out.write("*{0}:%x[{1},{2}]/%x[{1},{3}]\n".format(i, off, base_col + 3, base_col + 6)) # bigram 2
-                        i += 1
-                        out.write("*{0}:%x[{1},{2}]/%x[{1},{3}]/%x[{1},{4}]\n".format(i, off, base_col, base_col + 3, base_col + 6)) # trigram
-                        i += 1
+    groups.append(("lexical", [("ngram_{0}".format(j + 1), "{TRUE, FALSE}") for j in xrange(len(ngrams))]))
+    groups.append(("thematic", [("text_tiling_boundary", "{S,O}")]))
 
-                    out.write("\n")
+    return make_schema(groups, ["T", "F"])
 
-            for col in xrange(18 if visual else 42, 42 + len(ngrams) + (1 if tt else 0)):
-                out.write("*{0}:%x[{1},{2}]\n".format(i, off, col))
-                i += 1
 
-            out.write("\n")
+# Computes and writes patterns for the datafiles' columns
+def make_patterns(tt=False, visual=False, hinge=False):
+    groups = [group for group, enabled in [
+        ("syntactic", hinge), ("stylistic", visual), ("lexical", True), ("thematic", tt)
+    ] if enabled]
 
-    progress.finish()
+    with codecs.open(WAPITI_PATTERN_FILE, "w") as out:
+        i = write_patterns(out, schema, xrange(-2, 3), groups)
 
     print("# %s patterns built" % str(i - 1))
 
 
 # Evaluates the segmentation results
-def evaluate_segmentation(bc3=False, limit=-1):
-    d = "".join(data_to_list(WAPITI_TRAIN_FILE)) # training data
-    g = "".join(data_to_list(WAPITI_GOLD_FILE, limit=limit)) # gold string
-    temp_r = data_to_list(WAPITI_RESULT_FILE, limit=limit) # result string
+def evaluate_segmentation(train_file, gold_file, result_file, bc3=False, limit=-1):
+    d = "".join(data_to_list(train_file)) # training data
+    g = "".join(data_to_list(gold_file, limit=limit)) # gold string
+    temp_r = data_to_list(result_file, limit=limit) # result string
+
+    if bc3:
+        t = data_to_list(BC3_TEXT_TILING_FILE, limit=limit, label_position=0) # text tiling baseline string
+    else:
+        t = data_to_list(gold_file, limit=limit, label_position=-2)
+
+    return evaluate_labels(d, g, temp_r, t)
+
+
+# Computes scores from training labels (d), gold labels (g), results (temp_r, "label/score") and text tiling labels (t)
+def evaluate_labels(d, g, temp_r, t):
+    if len(g) == 0:
+        print("# no gold observation to evaluate")
+        return None
+
     # n = data_to_list("var/union/ngrams_" + WAPITI_RESULT_FILE[-1], limit=limit)
     
     # scores = {}
@@ -661,11 +1086,6 @@ def evaluate_segmentation(bc3=False, limit=-1):
     # for index in indexes:
     #     r = r[:index] + "T" + r[index+1:]
 
-    if bc3:
-        t = data_to_list(BC3_TEXT_TILING_FILE, limit=limit, label_position=0) # text tiling baseline string
-    else:
-        t = data_to_list(WAPITI_GOLD_FILE, limit=limit, label_position=-2)
-
     avg_g = float(len(g)) / (g.count("T") + 1) # average segment size (reference)
     avg_d = float(len(d)) / (d.count("T") + 1) # average segment size (training)
 
@@ -697,15 +1117,15 @@ def evaluate_segmentation(bc3=False, limit=-1):
     # precision, recall, f-measure
     pre_rs = metrics.precision_score(list(g), list(r), pos_label="T") * 100
     rec_rs = metrics.recall_score(list(g), list(r), pos_label="T") * 100
-    f_1_rs = (2.0 * (rec_rs * pre_rs)) / (rec_rs + pre_rs)
+    f_1_rs = (2.0 * (rec_rs * pre_rs)) / (rec_rs + pre_rs) if rec_rs + pre_rs > 0 else 0.0
 
     pre_bl = metrics.precision_score(list(g), list(b), pos_label="T") * 100
     rec_bl = metrics.recall_score(list(g), list(b), pos_label="T") * 100
-    f_1_bl = (2.0 * (rec_bl * pre_bl)) / (rec_bl + pre_bl)
+    f_1_bl = (2.0 * (rec_bl * pre_bl)) / (rec_bl + pre_bl) if rec_bl + pre_bl > 0 else 0.0
     
     pre_tt = metrics.precision_score(list(g), list(t), pos_label="T") * 100
     rec_tt = metrics.recall_score(list(g), list(t), pos_label="T") * 100
-    f_1_tt = (2.0 * (rec_tt * pre_tt)) / (rec_tt + pre_tt)
+    f_1_tt = (2.0 * (rec_tt * pre_tt)) / (rec_tt + pre_tt) if rec_tt + pre_tt > 0 else 0.0
 
     return acc_rs, acc_bl, acc_tt, pre_rs, pre_bl, pre_tt, rec_rs, rec_bl, rec_tt, f_1_rs, f_1_bl, f_1_tt, wdi_rs, wdi_bl, wdi_tt, bpk_rs, bpk_bl, bpk_tt, ghd_rs, ghd_bl, ghd_tt, g.count("T"), b.count("T"), r.count("T"), t.count("T")
 
@@ -729,6 +1149,13 @@ def write_evaluation(fold, evaluation):
         )
 
 
+# Writes the metrics of a fold's wapiti runs to the experiment's report (one json object per run)
+def write_wapiti_report(fold, report):
+    with codecs.open(WAPITI_REPORT_FILE, "a+") as out:
+        for metrics in report:
+            out.write(json.dumps(dict(metrics, fold=fold), sort_keys=True) + "\n")
+
+
 # Formats a float (0.26315 => "0.26")
 def dec(f):
     return "{0:.2f}".format(f)
@@ -736,16 +1163,21 @@ def dec(f):
 
 # Makes a string of labels
 def data_to_list(path, limit=-1, label_position=-1):
+    with codecs.open(path, "r") as f:
+        return lines_to_list(f, limit=limit, label_position=label_position)
+
+
+# Makes a string of labels from data lines
+def lines_to_list(lines, limit=-1, label_position=-1):
     s = []
 
-    with codecs.open(path, "r") as f:
-        for j, line in enumerate(f):
-            if len(s) == limit:
-                break
-            if not line.startswith("#"):
-                tokens = line.split()
-                if len(tokens) > 1:
-                    s.append(tokens[label_position].replace("F", ".").replace("O", ".").replace("S", "T"))
+    for j, line in enumerate(lines):
+        if len(s) == limit:
+            break
+        if not line.startswith("#"):
+            tokens = line.split()
+            if len(tokens) > 1:
+                s.append(tokens[label_position].replace("F", ".").replace("O", ".").replace("S", "T"))
 
     return s
 
@@ -887,6 +1319,10 @@ def merge_bow(a, b):
 
 
 def display_evaluations(scores):
+    if len(scores) == 0:
+        print("# no fold was evaluated")
+        return
+
     total = (
         0.0, 0.0, 0.0,
         0.0, 0.0, 0.0,
@@ -939,7 +1375,11 @@ def scores_to_string(
     s += "# F1:        \t{0}%\t\t{1}%\t{2}%\t\t{3}\t{4}\n".format(dec(f_1_rs), dec(f_1_bl), dec(f_1_rs - f_1_bl), dec(f_1_tt), dec(f_1_rs - f_1_tt))
     s += "#\n"
     s += "#            \tResult:\tBase.:\tT.T.:\n"
-    s += "# seg. ratio:\tx{0}\tx{1}\tx{2}".format(dec(float(rcount) / gcount), dec(float(bcount) / gcount), dec(float(tcount) / gcount))
+
+    if gcount > 0:
+        s += "# seg. ratio:\tx{0}\tx{1}\tx{2}".format(dec(float(rcount) / gcount), dec(float(bcount) / gcount), dec(float(tcount) / gcount))
+    else:
+        s += "# seg. ratio:\tn/a (no gold boundary)" # small folds may hold out messages without boundaries
 
     return s
 
@@ -963,7 +1403,7 @@ def standard_deviation(l):
 
 # Launch
 if __name__ == "__main__":
-    op = OptionParser(usage="usage: %prog [options] experiment_name")
+    op = OptionParser(usage="usage: %prog [options] experiment_name [message files (--segment)]")
 
     op.add_option("-s", "--save",
         dest="save",
@@ -1013,6 +1453,18 @@ if __name__ == "__main__":
         action="store_true",
         help="displays P, R and F1 for each fold (-bt required in current or previous run)")
 
+    op.add_option("--pipe",
+        dest="pipe",
+        default=False,
+        action="store_true",
+        help="builds, trains, labels and evaluates each fold without writing train, test, gold and result files (-p required in current or previous run)")
+
+    op.add_option("--featurize_once",
+        dest="featurize_once",
+        default=False,
+        action="store_true",
+        help="tags, lemmatizes and featurizes each message once for all folds, which only filter rare tokens and discretize features (tags are those of unfiltered lines)")
+
     op.add_option("--bc3",
         dest="bc3",
         default=False,
@@ -1061,6 +1513,36 @@ if __name__ == "__main__":
         default=10,
         help="number of folds for cross-validation (defaults to 10)")
 
+    op.add_option("--segment",
+        dest="segment",
+        default=False,
+        action="store_true",
+        help="labels the message files given after the experiment name with a model of the experiment (-t in current or previous run)")
+
+    op.add_option("--model_fold",
+        dest="model_fold",
+        type="int",
+        default=0,
+        help="fold whose model segments messages, if the experiment has several folds (defaults to 0)")
+
+    op.add_option("--worker_socket",
+        dest="worker_socket",
+        default=None,
+        type="string",
+        help="socket of a running labelling worker (bin/labelling_worker.py) used by --segment instead of starting one")
+
+    op.add_option("-j", "--jobs",
+        dest="jobs",
+        type="int",
+        default=1,
+        help="number of folds trained, labelled and evaluated concurrently, while the next folds are built (defaults to 1)")
+
+    op.add_option("--cpus",
+        dest="cpus",
+        type="int",
+        default=multiprocessing.cpu_count(),
+        help="number of cpus shared by the wapiti processes of concurrent folds (defaults to all cpus)")
+
     op.add_option("-x", "--experiments",
         dest="experiments",
         default=False,
@@ -1074,6 +1556,9 @@ if __name__ == "__main__":
     elif len(args) < 1:
         op.error("missing argument \"experiment_name\"")
 
+    if options.jobs < 1 or options.cpus < 1:
+        op.error("-j and --cpus must be at least 1")
+
     if options.all:
         options.save = options.train = options.build = options.patterns = options.label = options.evaluate = True
 